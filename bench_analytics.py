@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import count
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages'))
+
+import synthetic_data
+import training_metrics
+from repository import SQLiteRepository, TRAINING_COLUMNS
+from bench_queries import measure
+
+# Per-user latency of the training metrics engine at a given history size. By default the
+# rows are generated in memory, so this times frame building and the metrics pass only;
+# --sqlite PATH also loads them into an embedded database and times the fetch as well.
+PREFIX = 'bench_analytics'
+
+def history(size, seed):
+    sessions, total = [], 0
+    # Ten years per user, then more users' worth of years until the size is reached
+    for number in count():
+        for session in synthetic_data.generate_user(f"{PREFIX}_{size}", years=10, sessions_per_week=6,
+                                                    climbs_per_session=(10, 30), seed=seed + number):
+            session['climbs'] = session['climbs'][:size - total]
+            sessions.append(session)
+            total += len(session['climbs'])
+            if total >= size:
+                return sessions
+
+def run(sizes, repeat, seed, sqlite_path=None):
+    repo = None
+    if sqlite_path:
+        repo = SQLiteRepository(sqlite_path)
+        repo.migrate()
+    results = {}
+    for size in sizes:
+        sessions = history(size, seed)
+        rows = [tuple(climb[col] for col in TRAINING_COLUMNS) for s in sessions for climb in s['climbs']]
+        frame = training_metrics.climb_frame(rows)
+        result = {
+            'climbs': len(rows),
+            'frame_bytes_per_climb': round(frame.memory_usage(deep=True).sum() / len(rows), 1),
+            'climb_frame': measure(lambda: training_metrics.climb_frame(rows), repeat),
+            'compute': measure(lambda: training_metrics.compute(frame), repeat),
+            'frame + compute': measure(lambda: training_metrics.training_metrics(rows), repeat),
+        }
+        if repo is not None:
+            username = sessions[0]['username']
+            repo.delete_users(username)
+            repo.load_history(sessions)
+            result['fetch + frame + compute'] = measure(
+                lambda: training_metrics.training_metrics(repo.training_climbs(username)), repeat)
+            repo.delete_users(username)
+        results[size] = result
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the training metrics engine per user")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sqlite', metavar='PATH', help="Also time the fetch from an embedded database in this file")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = run(args.sizes, args.repeat, args.seed, args.sqlite)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for size, result in results.items():
+        print(f"\n{result['climbs']} climbs, {result['frame_bytes_per_climb']} bytes per climb in the frame")
+        print(f"{'case':28} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'peak KiB':>10}")
+        for name, r in result.items():
+            if isinstance(r, dict):
+                print(f"{name:28} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['max_ms']:9.2f} {r['peak_kib']:10.1f}")
+    print(f"\ntotal {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
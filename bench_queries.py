@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages'))
+
+import pandas as pd
+import synthetic_data
+from repository import get_repository, SQLiteRepository, SESSION_DATA_COLUMNS
+from analytics import grade_stats, weekly_frame
+
+# End-to-end timings of the page query paths against a seeded synthetic history. Uses the
+# backend from .streamlit/secrets.toml (point it at a local Postgres, never production),
+# or --sqlite PATH for the embedded stand-in.
+PREFIX = 'bench_user'
+
+def measure(fn, repeat):
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    # Inclusive, so p95 stays within the observed timings for small --repeat values
+    quantiles = statistics.quantiles(timings, n=20, method='inclusive') if len(timings) > 1 else timings * 19
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(quantiles[18], 2),
+        'max_ms': round(max(timings), 2),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+def seed(repo, args):
+    repo.delete_users(PREFIX)
+    started = time.perf_counter()
+    sessions, climbs = repo.load_history(list(synthetic_data.generate(
+        args.users, args.years, args.sessions_per_week, (args.min_climbs, args.max_climbs), args.seed, PREFIX)))
+    print(f"Seeded {sessions} sessions / {climbs} climbs in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def cases(repo, username, rng):
+    session_ids = [row[0] for row in repo.session_data(username)]
+    sample_climbs = [climb for s in islice(synthetic_data.generate_user(username), 5) for climb in s['climbs']]
+
+    def session_data():
+        pd.DataFrame(repo.session_data(username), columns=SESSION_DATA_COLUMNS)
+
+    def weekly_rollups():
+        weekly_frame(repo.weekly_rollups(username))
+
+    def send_stats():
+        rows = repo.send_histogram(username)
+        if rows:
+            grade_stats(rows)
+
+    def summary():
+        repo.session_summary(rng.choice(session_ids))
+
+    def climb_insert():
+        # Same call the write-behind flusher makes for one queued climb
+        climb = rng.choice(sample_climbs)
+        repo.apply_writes([('climb', dict(climb, username=username, session_id=rng.choice(session_ids),
+                                          client_id=str(uuid.uuid4()), climb_date=climb['climb_date'].isoformat()))])
+
+    return {
+        'session_data + DataFrame': session_data,
+        'weekly_rollups + weekly_frame': weekly_rollups,
+        'send_histogram + grade_stats': send_stats,
+        'session_summary': summary,
+        'apply_writes (one climb)': climb_insert,
+    }
+
+def run(repo, args):
+    repo.migrate()
+    if not args.skip_seed:
+        seed(repo, args)
+    rng = random.Random(args.seed)
+    username = f"{PREFIX}_0"
+    results = {}
+    for name, fn in cases(repo, username, rng).items():
+        fn()  # warm up plans and caches
+        results[name] = measure(fn, args.repeat)
+    if not args.keep:
+        repo.delete_users(PREFIX)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the page query paths on synthetic data")
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--sessions-per-week', type=float, default=4)
+    parser.add_argument('--min-climbs', type=int, default=15)
+    parser.add_argument('--max-climbs', type=int, default=35)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sqlite', metavar='PATH', help="Benchmark the embedded backend in this file instead")
+    parser.add_argument('--skip-seed', action='store_true', help="Reuse data from a previous --keep run")
+    parser.add_argument('--keep', action='store_true', help="Leave the synthetic users in the database")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    repo = SQLiteRepository(args.sqlite) if args.sqlite else get_repository()
+    results = run(repo, args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"backend: {repo.name}")
+    print(f"{'case':36} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'peak KiB':>10}")
+    for name, r in results.items():
+        print(f"{name:36} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['max_ms']:9.2f} {r['peak_kib']:10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+sys.path.insert(0, PAGES_DIR)
+
+# Cold-start import cost and per-rerun style payload of main.py, before and after lazy loading.
+# "eager" is what main.py imported up front when analytics was a top-level import.
+EAGER_MODULES = ['session', 'repository', 'write_queue', 'query_cache', 'diagnostics', 'instrumentation', 'analytics']
+LAZY_MODULES = ['session', 'repository', 'write_queue', 'query_cache', 'diagnostics', 'instrumentation', 'assets']
+
+def import_seconds(modules, runs):
+    code = ("import sys, time; sys.path.insert(0, %r); started = time.perf_counter(); "
+            "import %s; print(time.perf_counter() - started)") % (PAGES_DIR, ', '.join(modules))
+    timings = []
+    for _ in range(runs):
+        # Fresh interpreter each time so nothing is already in sys.modules
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+def style_payload_bytes():
+    from assets import page_css
+
+    return len(page_css('background.jpg', False).encode()), len(page_css('background.jpg', True).encode())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start imports and per-rerun style payload")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    eager = import_seconds(EAGER_MODULES, args.runs)
+    lazy = import_seconds(LAZY_MODULES, args.runs)
+    inline, static = style_payload_bytes()
+    print(f"cold start imports (median of {args.runs}): eager {eager * 1000:.0f} ms, lazy {lazy * 1000:.0f} ms")
+    print(f"style payload per rerun: inline base64 {inline / 1024:.0f} KiB, static serving {static} bytes")
+
+if __name__ == '__main__':
+    main()
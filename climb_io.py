@@ -0,0 +1,239 @@
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages'))
+
+from db_singleton import db_cursor
+from grades import encode_grade, discipline, JUDGMENTS
+import rollups
+import gym_stats
+from partitions import month_start
+
+# Columns in import and export files. start_time/end_time are optional on import;
+# climbs logged at the same gym on the same day are grouped into one session.
+FILE_COLUMNS = ['username', 'gym_name', 'climb_date', 'climb_name', 'grade', 'grade_judgment', 'num_attempts',
+                'sent', 'notes', 'star_rating', 'start_time', 'end_time']
+STAGING_COLUMNS = ['line', 'username', 'gym_name', 'climb_date', 'climb_name', 'grade', 'grade_code', 'type',
+                   'grade_judgment', 'num_attempts', 'sent', 'notes', 'star_rating', 'start_time', 'end_time']
+CHUNK_ROWS = 10000
+
+def read_rows(path):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        # Row-group batches keep memory flat for large files
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=CHUNK_ROWS):
+            yield from batch.to_pylist()
+    else:
+        with open(path, newline='') as f:
+            yield from csv.DictReader(f)
+
+def _blank(value):
+    return value is None or str(value).strip() == ''
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+# ISO date or timestamp text (Parquet gives date/datetime objects, whose str() is ISO too)
+def _parse_iso(name, value, parse):
+    try:
+        return str(parse(str(value).strip()))
+    except ValueError:
+        raise ValueError(f"{name} {value!r} is not in ISO format") from None
+
+def _parse_int(name, value, low, high):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} {value!r} is not a whole number") from None
+    if not low <= number <= high:
+        raise ValueError(f"{name} must be from {low} to {high}")
+    return number
+
+# Check one row against the gym's grade list and shape it for the staging table
+def validate_row(line, row):
+    for required in ('username', 'gym_name', 'climb_date', 'grade'):
+        if _blank(row.get(required)):
+            raise ValueError(f"missing {required}")
+    grade_code = encode_grade(row['gym_name'], str(row['grade']))
+    if grade_code is None:
+        raise ValueError(f"grade {row['grade']!r} is not on the {row['gym_name']!r} grade list")
+    # Anything COPY would reject is caught here, so one bad value fails its line, not the batch
+    climb_date = _parse_iso('climb_date', row['climb_date'], date.fromisoformat)
+    judgment = 'On' if _blank(row.get('grade_judgment')) else str(row['grade_judgment'])
+    if judgment not in JUDGMENTS:
+        raise ValueError(f"grade_judgment {judgment!r} is not one of {', '.join(JUDGMENTS)}")
+    return [
+        line, row['username'], row['gym_name'], climb_date, row.get('climb_name') or '', str(row['grade']),
+        grade_code, discipline(row['gym_name'], str(row['grade'])), judgment,
+        None if _blank(row.get('num_attempts')) else _parse_int('num_attempts', row['num_attempts'], 1, 100),
+        _parse_bool(row.get('sent')),
+        row.get('notes') or '', None if _blank(row.get('star_rating')) else _parse_int('star_rating', row['star_rating'], 0, 5),
+        None if _blank(row.get('start_time')) else _parse_iso('start_time', row['start_time'], datetime.fromisoformat),
+        None if _blank(row.get('end_time')) else _parse_iso('end_time', row['end_time'], datetime.fromisoformat),
+    ]
+
+def _copy_chunk(c, chunk):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in chunk:
+        writer.writerow(['' if v is None else v for v in values])
+    buffer.seek(0)
+    c.copy_expert(f"COPY climbs_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def import_climbs(path, skip_invalid=False):
+    started = time.perf_counter()
+    loaded = 0
+    errors = []
+    with db_cursor() as (conn, c):
+        c.execute('''CREATE TEMP TABLE climbs_import
+                     (line INTEGER, username TEXT, gym_name TEXT, climb_date DATE, climb_name TEXT, grade TEXT,
+                     grade_code SMALLINT, type TEXT, grade_judgment TEXT, num_attempts INTEGER, sent BOOLEAN,
+                     notes TEXT, star_rating INT, start_time TIMESTAMP, end_time TIMESTAMP) ON COMMIT DROP''')
+        chunk = []
+        for line, row in enumerate(read_rows(path), start=2):
+            try:
+                chunk.append(validate_row(line, row))
+            except (ValueError, TypeError) as e:
+                errors.append(f"line {line}: {e}")
+                continue
+            if len(chunk) == CHUNK_ROWS:
+                _copy_chunk(c, chunk)
+                loaded += len(chunk)
+                chunk = []
+        if chunk:
+            _copy_chunk(c, chunk)
+            loaded += len(chunk)
+
+        if errors and not skip_invalid:
+            conn.rollback()
+            raise SystemExit("Import aborted, invalid rows:\n" + '\n'.join(errors[:50]))
+
+        # One session per user, gym and day, with ids drawn up front so climbs can join to them
+        c.execute('''CREATE TEMP TABLE import_sessions ON COMMIT DROP AS
+                     SELECT nextval(pg_get_serial_sequence('sessions', 'session_id')) AS session_id,
+                            username, gym_name, climb_date,
+                            COALESCE(MIN(start_time), climb_date::timestamp) AS start_time,
+                            MAX(end_time) AS end_time
+                     FROM climbs_import
+                     GROUP BY username, gym_name, climb_date''')
+        c.execute('''INSERT INTO sessions (session_id, username, start_time, end_time, gym_name, duration)
+                     SELECT session_id, username, start_time, end_time, gym_name,
+                            EXTRACT(EPOCH FROM end_time - start_time)::int
+                     FROM import_sessions''')
+        sessions = c.rowcount
+        c.execute('''INSERT INTO climbs (session_id, climb_date, climb_name, gym_name, grade, grade_code, type,
+                                         grade_judgment, num_attempts, sent, notes, star_rating)
+                     SELECT s.session_id, i.climb_date, i.climb_name, i.gym_name, i.grade, i.grade_code, i.type,
+                            i.grade_judgment, i.num_attempts, i.sent, i.notes, i.star_rating
+                     FROM climbs_import i
+                     JOIN import_sessions s USING (username, gym_name, climb_date)
+                     ORDER BY i.line''')
+        c.execute("SELECT DISTINCT username FROM import_sessions")
+        users = [row[0] for row in c.fetchall()]
+        # The gym aggregates job only refreshes recent months; recompute from the oldest imported
+        # one, waiting out a running refresh so the two don't write the same rows
+        c.execute("SELECT MIN(climb_date) FROM climbs_import")
+        first = c.fetchone()[0]
+        if first is not None:
+            c.execute("SELECT pg_advisory_xact_lock(%s)", (gym_stats.MAINTENANCE_LOCK_ID,))
+            gym_stats.refresh(c, month_start(first))
+        conn.commit()
+
+        for username in users:
+            rollups.rebuild(conn, c, username)
+
+    elapsed = time.perf_counter() - started
+    for error in errors:
+        print(f"Skipped {error}", file=sys.stderr)
+    print(f"Imported {loaded} climbs in {sessions} sessions in {elapsed:.1f}s ({loaded / elapsed:.0f} rows/sec)")
+    return loaded
+
+# Fixed Parquet types for FILE_COLUMNS; inferring them from the first chunk would type columns
+# that happen to be all NULL there as null and reject the chunks after it
+def _parquet_schema(pa):
+    return pa.schema([
+        ('username', pa.string()), ('gym_name', pa.string()), ('climb_date', pa.date32()),
+        ('climb_name', pa.string()), ('grade', pa.string()), ('grade_judgment', pa.string()),
+        ('num_attempts', pa.int32()), ('sent', pa.bool_()), ('notes', pa.string()), ('star_rating', pa.int32()),
+        ('start_time', pa.timestamp('us')), ('end_time', pa.timestamp('us')),
+    ])
+
+EXPORT_SQL = '''
+    SELECT sessions.username, climbs.gym_name, climbs.climb_date, climbs.climb_name, climbs.grade,
+           climbs.grade_judgment, climbs.num_attempts, climbs.sent, climbs.notes, climbs.star_rating,
+           sessions.start_time, sessions.end_time
+    FROM climbs
+    JOIN sessions ON sessions.session_id = climbs.session_id
+    WHERE (%(username)s IS NULL OR sessions.username = %(username)s)
+    ORDER BY climbs.climb_date, climbs.id
+'''
+
+def export_climbs(path, username=None, chunk_size=5000):
+    started = time.perf_counter()
+    exported = 0
+    parquet_writer = None
+    out = None
+    with db_cursor() as (conn, c):
+        # Named cursor: rows stay on the server and arrive chunk_size at a time
+        with conn.cursor(name='climb_export') as export_cursor:
+            export_cursor.itersize = chunk_size
+            export_cursor.execute(EXPORT_SQL, {'username': username})
+            try:
+                if path.endswith('.parquet'):
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+
+                    schema = _parquet_schema(pa)
+                    parquet_writer = pq.ParquetWriter(path, schema)
+                else:
+                    out = sys.stdout if path == '-' else open(path, 'w', newline='')
+                    writer = csv.writer(out)
+                    writer.writerow(FILE_COLUMNS)
+                while True:
+                    rows = export_cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    if out is None:
+                        parquet_writer.write_table(
+                            pa.Table.from_pylist([dict(zip(FILE_COLUMNS, row)) for row in rows], schema=schema))
+                    else:
+                        writer.writerows(rows)
+                    exported += len(rows)
+            finally:
+                if parquet_writer is not None:
+                    parquet_writer.close()
+                if out is not None and out is not sys.stdout:
+                    out.close()
+        conn.rollback()
+
+    elapsed = time.perf_counter() - started
+    print(f"Exported {exported} climbs in {elapsed:.1f}s ({exported / elapsed:.0f} rows/sec)", file=sys.stderr)
+    return exported
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import and export of climb history")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="Load a CSV or Parquet file of climbs")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--skip-invalid', action='store_true', help="Load valid rows and report the rest")
+
+    export_parser = commands.add_parser('export', help="Write climbs to CSV or Parquet ('-' for stdout)")
+    export_parser.add_argument('path')
+    export_parser.add_argument('--username', help="Only export this user's climbs")
+    export_parser.add_argument('--chunk-size', type=int, default=5000)
+
+    args = parser.parse_args(argv)
+    if args.command == 'import':
+        import_climbs(args.path, args.skip_invalid)
+    else:
+        export_climbs(args.path, args.username, args.chunk_size)
+
+if __name__ == '__main__':
+    main()
@@ -1,72 +1,138 @@
 import streamlit as st
 import plotly.express as px
 import pandas as pd
-from db_singleton import get_db, create_tables_if_not_exist, close_db
-
-st.set_page_config(
-    page_title="Climbing Analytics Dashboard",
-    page_icon="🧗",
-    layout="wide",
-)
-
-# Function to fetch session data from the database
-def get_session_data(username, cursor):
-    cursor.execute("""
-        SELECT 
-            sessions.session_id,
-            CONCAT(sessions.gym_name, ' (', start_time::date, ')') as session_name,
-            start_time,
-            end_time,
-            COUNT(climbs.id) as num_climbs,
-            MODE() WITHIN GROUP (ORDER BY climbs.grade) as most_frequent_grade
-        FROM sessions
-        LEFT JOIN climbs ON sessions.session_id = climbs.session_id
-        WHERE username = %s
-        GROUP BY sessions.session_id, start_time, end_time
-        ORDER BY start_time DESC
-    """, (username,))
-    return cursor.fetchall()
+import numpy as np
+import query_cache
+import training_metrics
+import recommender
+from instrumentation import timed_page
+from repository import get_repository, ROLLUP_COLUMNS, SEND_HISTOGRAM_COLUMNS, SESSION_DATA_COLUMNS
+from grades import CODE_LABELS, SCALE_BY_PREFIX
+
+# Hardest send per week and average sent difficulty from the integer codes
+def grade_stats(send_rows):
+    df = pd.DataFrame(send_rows, columns=SEND_HISTOGRAM_COLUMNS)
+    codes = df['grade_code'].to_numpy(dtype=np.int16)
+    counts = df['sends'].to_numpy(dtype=np.int64)
+    df['scale'] = pd.Categorical.from_codes(codes // 100 - 1, list(SCALE_BY_PREFIX.values()))
+    df['ordinal'] = codes % 100
+    df['week'] = df['iso_year'].astype(str) + '-W' + df['iso_week'].astype(str).str.zfill(2)
+
+    hardest = df.groupby(['week', 'scale'], observed=True)['grade_code'].max().reset_index()
+    hardest['ordinal'] = hardest['grade_code'] % 100
+    hardest['grade'] = hardest['grade_code'].map(CODE_LABELS)
+
+    average = {}
+    for prefix, scale in SCALE_BY_PREFIX.items():
+        mask = codes // 100 == prefix
+        if counts[mask].sum():
+            mean_ordinal = np.average(codes[mask] % 100, weights=counts[mask])
+            average[scale] = (mean_ordinal, CODE_LABELS[prefix * 100 + int(round(mean_ordinal))])
+    return hardest, average
+
+# Convert the rollups to a DataFrame, already ordered by ISO year and week
+def weekly_frame(weekly_data):
+    df_weeks = pd.DataFrame(weekly_data, columns=ROLLUP_COLUMNS)
+    df_weeks['week'] = df_weeks['iso_year'].astype(str) + '-W' + df_weeks['iso_week'].astype(str).str.zfill(2)
+    df_weeks['total_minutes'] = df_weeks['total_minutes'].astype(float)
+    return df_weeks
+
+# Run a per-user repository read through the query cache, only hitting the database on a miss
+def cached_query(name, username):
+    repo = get_repository()
+    return query_cache.cached(name, username, lambda: getattr(repo, name)(username))
+
+# Weekly training series, pyramid and totals, recomputed only when this user's data changes
+def cached_training_metrics(username):
+    repo = get_repository()
+    return query_cache.cached('training_metrics', username,
+                              lambda: training_metrics.training_metrics(repo.training_climbs(username)))
+
+def show_training_metrics(metrics):
+    totals, weekly, pyramid = metrics['totals'], metrics['weekly'], metrics['pyramid']
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Send rate", f"{totals['send_rate']:.0%}")
+    col2.metric("Flash rate", f"{totals['flash_rate']:.0%}")
+    col3.metric("Attempts per send", f"{totals['attempts_per_send']:.1f}" if totals['attempts_per_send'] else "N/A")
+    col4.metric("Average stars", f"{totals['avg_stars']:.1f}")
+
+    weekly = weekly.assign(unsent=weekly['climbs'] - weekly['sends'])
+    fig_volume = px.bar(weekly, x='week', y=['sends', 'unsent'], title='Weekly Volume (Climbs)',
+                        hover_data=['attempts', 'soft', 'hard'])
+    st.plotly_chart(fig_volume)
+
+    fig_rates = px.line(weekly, x='week', y=['send_rate', 'flash_rate'], title='Send and Flash Rate per Week')
+    fig_rates.update_yaxes(tickformat='.0%')
+    st.plotly_chart(fig_rates)
+
+    fig_attempts = px.line(weekly, x='week', y='attempts_per_send', title='Attempts per Send')
+    st.plotly_chart(fig_attempts)
+
+    fig_load = px.line(weekly, x='week', y=['load', 'rolling_load'],
+                       title=f'Training Load (grade-weighted attempts, {training_metrics.ROLLING_WEEKS}-week rolling sum)')
+    st.plotly_chart(fig_load)
+
+    pyramid = pyramid.assign(unsent=pyramid['climbs'] - pyramid['sends'])
+    fig_pyramid = px.bar(pyramid, x=['sends', 'unsent'], y='grade', orientation='h', title='Grade Pyramid',
+                         hover_data=['scale'])
+    fig_pyramid.update_yaxes(categoryorder='array', categoryarray=pyramid['grade'].tolist())
+    st.plotly_chart(fig_pyramid)
 
 # Function to show the analytics page
+@timed_page
 def show_analytics_page():
-    # Initialize database connection
-    db = get_db()
-    conn = db['conn']
-    c = db['cursor']
-
     # Check if 'username' exists and is not None
     if 'username' in st.session_state and st.session_state['username'] is not None:
         username = st.session_state['username']
         st.session_state['username'] = username  # Explicitly set username
  
-        # Fetch session data
-        session_data = get_session_data(username, c)
-        
-        # Convert to DataFrame
-        df_sessions = pd.DataFrame(session_data, columns=['session_id', 'session_name', 'start_time', 'end_time', 'num_climbs', 'most_frequent_grade'])
-        
-        # Convert 'start_time' and 'end_time' to datetime and extract the week number
-        df_sessions['start_time'] = pd.to_datetime(df_sessions['start_time'])
-        df_sessions['end_time'] = pd.to_datetime(df_sessions['end_time'])
-        df_sessions['week_num'] = df_sessions['start_time'].dt.strftime('%U')
-        
-        # Sort the DataFrame by week_num in ascending order
-        df_sessions.sort_values(by='week_num', inplace=True)
-        
-        # Calculate session length in minutes
-        df_sessions['session_length'] = (df_sessions['end_time'] - df_sessions['start_time']).dt.total_seconds() / 60
-        
-        if not df_sessions.empty:
+        # Fetch the weekly rollups (cached until this user's data changes)
+        weekly_data = cached_query('weekly_rollups', username)
+
+        df_weeks = weekly_frame(weekly_data)
+
+        if not df_weeks.empty:
             # Create a high-level Plotly bar chart to show the total session time per week
-            fig_weekly_sessions = px.bar(df_sessions, 
-                                         x='week_num', 
-                                         y='session_length', 
-                                         color='session_name', 
+            fig_weekly_sessions = px.bar(df_weeks,
+                                         x='week',
+                                         y='total_minutes',
                                          title='Total Session Time per Week (Minutes)',
-                                         hover_data=['num_climbs', 'most_frequent_grade'])  # Add num_climbs and most_frequent_grade to hover data
-            
-            # Update x-axis to display only whole integers
+                                         hover_data=['climb_count', 'sends'])
+
+            # Keep weeks as categories so gaps and year boundaries stay readable
             fig_weekly_sessions.update_xaxes(type='category')
-            
+
             st.plotly_chart(fig_weekly_sessions)
-            close_db()
\ No newline at end of file
+
+        send_rows = cached_query('send_histogram', username)
+
+        if send_rows:
+            hardest, average = grade_stats(send_rows)
+
+            # Average sent difficulty per grade scale
+            for col, (scale, (mean_ordinal, label)) in zip(st.columns(len(average)), average.items()):
+                col.metric(f"Average {scale} send", label, f"ordinal {mean_ordinal:.1f}", delta_color='off')
+
+            fig_hardest = px.line(hardest, x='week', y='ordinal', color='scale', markers=True,
+                                  title='Hardest Send per Week', hover_data=['grade'])
+            fig_hardest.update_xaxes(type='category')
+            st.plotly_chart(fig_hardest)
+
+        metrics = cached_training_metrics(username)
+        if metrics['totals']:
+            show_training_metrics(metrics)
+
+        # Unsent climbs that look most like what this user has been sending lately
+        projects = recommender.recommendations(get_repository(), username)['projects']
+        if projects:
+            st.subheader("Next Projects")
+            st.dataframe(projects, hide_index=True)
+
+        # Per-session detail scans the whole history, so only load it on request
+        if st.checkbox("Show session details"):
+            session_data = cached_query('session_data', username)
+            df_sessions = pd.DataFrame(session_data, columns=SESSION_DATA_COLUMNS)
+            st.dataframe(df_sessions, hide_index=True)
+
+        cache_stats = query_cache.stats()
+        st.caption(f"Query cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['bytes'] // 1024} KiB")
@@ -0,0 +1,59 @@
+import base64
+import hashlib
+import mimetypes
+import os
+from functools import lru_cache
+import streamlit as st
+
+# Static files are read and hashed once per process. With server.enableStaticServing the
+# browser fetches them from app/static/ and caches them, so each rerun only ships a few
+# hundred bytes of CSS instead of the whole image inlined as base64.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+SLIDER_CSS = """
+    /* Change the slider line thickness and color */
+    div[data-baseweb="slider"] > div > div {
+        height: 8px !important;
+        background-color: yellow !important;
+    }
+    /* Change the slider thumb size and color */
+    div[role="slider"] {
+        width: 20px !important;
+        height: 20px !important;
+        background-color: yellow !important;
+    }
+"""
+
+@lru_cache(maxsize=None)
+def content_hash(filename):
+    with open(os.path.join(STATIC_DIR, filename), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+@lru_cache(maxsize=None)
+def asset_url(filename, static_serving):
+    if static_serving:
+        # The content hash busts the browser cache only when the file actually changes
+        return f"app/static/{filename}?v={content_hash(filename)}"
+    with open(os.path.join(STATIC_DIR, filename), 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode()
+    mime = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return f"data:{mime};base64,{encoded}"
+
+@lru_cache(maxsize=None)
+def page_css(background, static_serving):
+    return f"""
+        <style>
+            .stApp {{
+                background: url({asset_url(background, static_serving)});
+                background-size: cover;
+            }}
+            {SLIDER_CSS}
+        </style>
+    """
+
+# Emit the app's styles; the CSS string itself is built once per process
+def inject_styles(background='background.jpg'):
+    try:
+        st.markdown(page_css(background, bool(st.get_option("server.enableStaticServing"))), unsafe_allow_html=True)
+    except FileNotFoundError:
+        st.error(f"File {background} not found.")
@@ -0,0 +1,119 @@
+import argparse
+import hashlib
+import io
+import os
+import tempfile
+import uuid
+import streamlit as st
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'blob_store')
+
+# Content-addressed blobs on the local filesystem, sharded by the first bytes of the hash
+class LocalBlobStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, data):
+        return self._write(hashlib.sha256(data).hexdigest(), data)
+
+    # A random key no other blob shares, for data that is deleted later: deleting a
+    # content-addressed key could remove a blob another climb still points at
+    def put_private(self, data):
+        return self._write(f"{uuid.uuid4().hex}.private", data)
+
+    def _write(self, key, data):
+        path = self._path(key)
+        # Identical uploads hash to the same key, so they are only written once
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        return key
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+# Other stores (S3 etc.) only need put/put_private/get/exists/delete and a register_backend call
+_backends = {'local': LocalBlobStore}
+_store = None
+
+def register_backend(name, factory):
+    _backends[name] = factory
+
+def get_blob_store():
+    global _store
+    if _store is None:
+        config = dict(st.secrets.get("blob_store", {}))
+        backend = config.pop("backend", "local")
+        _store = _backends[backend](**config)
+    return _store
+
+# Read width and height without keeping the decoded image around
+def image_metadata(data):
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+def store_photo(data):
+    width, height = image_metadata(data)
+    return {
+        'photo_key': get_blob_store().put(data),
+        'photo_width': width,
+        'photo_height': height,
+        'photo_size': len(data),
+    }
+
+# Move BYTEA photos into the blob store a batch at a time, committing after each batch
+def migrate_photos(conn, c, batch_size=50):
+    last_id = 0
+    moved = 0
+    while True:
+        c.execute("""SELECT id, photo FROM climbs
+                     WHERE id > %s AND photo IS NOT NULL AND photo_key IS NULL
+                     ORDER BY id LIMIT %s""", (last_id, batch_size))
+        rows = c.fetchall()
+        if not rows:
+            break
+        for climb_id, photo in rows:
+            meta = store_photo(bytes(photo))
+            c.execute("""UPDATE climbs
+                         SET photo_key = %s, photo_width = %s, photo_height = %s, photo_size = %s, photo = NULL
+                         WHERE id = %s""",
+                      (meta['photo_key'], meta['photo_width'], meta['photo_height'], meta['photo_size'], climb_id))
+        conn.commit()
+        last_id = rows[-1][0]
+        moved += len(rows)
+        print(f"Moved {moved} photos (last id {last_id})")
+    return moved
+
+if __name__ == '__main__':
+    from db_singleton import db_cursor
+
+    parser = argparse.ArgumentParser(description="Move climbs.photo BYTEA values into the blob store")
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+    with db_cursor() as (conn, c):
+        total = migrate_photos(conn, c, args.batch_size)
+    print(f"Done, {total} photos migrated.")
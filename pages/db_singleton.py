@@ -1,117 +1,135 @@
 import psycopg2
+from psycopg2 import pool as pg_pool
 import streamlit as st
-import atexit  
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from instrumentation import InstrumentedCursor
 
-_db_instance = None
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_last_used = {}
+_stats = {'checkouts': 0, 'wait_time': 0.0, 'max_wait': 0.0, 'stale_replaced': 0, 'in_use': 0}
 
-def get_db():
-    global _db_instance
-    if _db_instance is None:
-        # Retrieve database connection information from Streamlit secrets
-        conn_info = st.secrets["postgres"]
+# Connections idle for longer than this are pinged before being handed out
+STALE_AFTER_SECONDS = 60
 
-        conn = psycopg2.connect(
-            host=conn_info["host"],
-            port=conn_info["port"],
-            dbname=conn_info["dbname"],
-            user=conn_info["user"],
-            password=conn_info["password"],
-        )
-        c = conn.cursor()
-        _db_instance = {'conn': conn, 'cursor': c}
+def get_pool():
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Retrieve database connection information from Streamlit secrets
+                conn_info = st.secrets["postgres"]
+                minconn = int(conn_info.get("pool_min", 1))
+                maxconn = int(conn_info.get("pool_max", 5))
 
-        # Register close_db to be called when the application terminates
-        atexit.register(close_db)
-    return _db_instance
+                _pool = pg_pool.ThreadedConnectionPool(
+                    minconn,
+                    maxconn,
+                    host=conn_info["host"],
+                    port=conn_info["port"],
+                    dbname=conn_info["dbname"],
+                    user=conn_info["user"],
+                    password=conn_info["password"],
+                )
+                # ThreadedConnectionPool raises when exhausted, so bound checkouts
+                # with a semaphore to make callers wait for a free connection instead
+                _slots = threading.BoundedSemaphore(maxconn)
 
-def create_tables_if_not_exist(cursor, connection):
-    try:
-        # Create new tables
-        cursor.execute('''CREATE TABLE IF NOT EXISTS sessions
-                        (session_id SERIAL PRIMARY KEY,
-                        username TEXT,
-                        start_time TIMESTAMP,
-                        end_time TIMESTAMP,
-                        gym_name TEXT,
-                        duration INTEGER)''')
-
-        cursor.execute('''CREATE TABLE IF NOT EXISTS climbs
-                        (id SERIAL PRIMARY KEY,
-                        session_id INTEGER,
-                        photo BYTEA,
-                        climb_date DATE,
-                        climb_name TEXT,
-                        gym_name TEXT,
-                        grade TEXT,
-                        grade_judgment TEXT,
-                        num_attempts INTEGER,
-                        sent BOOLEAN,
-                        notes TEXT,
-                        star_rating INT,
-                        type TEXT,  -- New column
-                        FOREIGN KEY(session_id) REFERENCES sessions(session_id))''')
+                # Register close_db to be called when the application terminates
+                atexit.register(close_db)
+    return _pool
 
-        connection.commit()
-    except Exception as e:
-            # If an error occurs, rollback the transaction
-        connection.rollback()
-        print(f"An error occurred: {e}")
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < STALE_AFTER_SECONDS:
+        return True
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
-def drop_tables(cursor, connection):
+def _checkout():
+    pool = get_pool()
+    wait_start = time.perf_counter()
+    _slots.acquire()
+    replaced = 0
     try:
-        cursor.execute("DROP TABLE IF EXISTS climbs CASCADE;")
-        cursor.execute("DROP TABLE IF EXISTS sessions CASCADE;")
-        connection.commit()
-        print("Tables 'climbs' and 'sessions' dropped successfully.")
-    except Exception as e:
-        # If an error occurs, rollback the transaction
-        connection.rollback()
-        print(f"An error occurred while dropping tables: {e}")
-            
-def close_db():
-    global _db_instance
-    if _db_instance is not None:
-        _db_instance['cursor'].close()
-        _db_instance['conn'].close()
-        _db_instance = None
+        conn = pool.getconn()
+        while not _is_healthy(conn):
+            # Throw away the dead connection and open a fresh one in its place
+            pool.putconn(conn, close=True)
+            replaced += 1
+            conn = pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+    waited = time.perf_counter() - wait_start
+    with _pool_lock:
+        _stats['checkouts'] += 1
+        _stats['stale_replaced'] += replaced
+        _stats['in_use'] += 1
+        _stats['wait_time'] += waited
+        _stats['max_wait'] = max(_stats['max_wait'], waited)
+    return conn
 
-def create_tables_if_not_exist(cursor, connection):
+def _return(conn, broken=False):
+    if broken or conn.closed:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
     try:
-        # Create new tables
-        cursor.execute('''CREATE TABLE IF NOT EXISTS sessions
-                        (session_id SERIAL PRIMARY KEY,
-                        username TEXT,
-                        start_time TIMESTAMP,
-                        end_time TIMESTAMP,
-                        gym_name TEXT,
-                        duration INTEGER)''')
+        if _pool is not None:
+            _pool.putconn(conn, close=broken or conn.closed)
+    finally:
+        with _pool_lock:
+            _stats['in_use'] -= 1
+        _slots.release()
 
-        cursor.execute('''CREATE TABLE IF NOT EXISTS climbs
-                        (id SERIAL PRIMARY KEY,
-                        session_id INTEGER,
-                        photo BYTEA,
-                        climb_date DATE,
-                        climb_name TEXT,
-                        gym_name TEXT,
-                        grade TEXT,
-                        grade_judgment TEXT,
-                        num_attempts INTEGER,
-                        sent BOOLEAN,
-                        notes TEXT,
-                        star_rating INT,
-                        type TEXT,  -- New column
-                        FOREIGN KEY(session_id) REFERENCES sessions(session_id))''')
+# Check out a connection and cursor for the duration of a request
+@contextmanager
+def db_cursor():
+    conn = _checkout()
+    broken = False
+    try:
+        with conn.cursor() as c:
+            yield conn, InstrumentedCursor(c)
+    except BaseException:
+        # Never hand a connection back to the pool with a half-finished transaction
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        _return(conn, broken)
 
-        connection.commit()
-    except Exception as e:
-            # If an error occurs, rollback the transaction
-        connection.rollback()
-        print(f"An error occurred: {e}")
+def pool_stats():
+    stats = dict(_stats)
+    if _pool is not None:
+        stats['pool_min'] = _pool.minconn
+        stats['pool_max'] = _pool.maxconn
+        stats['pool_size'] = len(_pool._pool) + len(_pool._used)
+        stats['idle'] = len(_pool._pool)
+    stats['avg_wait'] = stats['wait_time'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    return stats
 
 def drop_tables(cursor, connection):
     try:
+        cursor.execute("DROP TABLE IF EXISTS gym_hourly_stats, gym_grade_stats, gym_monthly_levels;")
+        cursor.execute("DROP TABLE IF EXISTS weekly_rollups CASCADE;")
+        cursor.execute("DROP TABLE IF EXISTS session_summaries CASCADE;")
         cursor.execute("DROP TABLE IF EXISTS climbs CASCADE;")
         cursor.execute("DROP TABLE IF EXISTS sessions CASCADE;")
+        # Forget applied migrations so the next startup recreates the schema
+        cursor.execute("DROP TABLE IF EXISTS schema_version;")
         connection.commit()
         print("Tables 'climbs' and 'sessions' dropped successfully.")
     except Exception as e:
@@ -120,9 +138,9 @@ def drop_tables(cursor, connection):
         print(f"An error occurred while dropping tables: {e}")
             
 def close_db():
-    global _db_instance
-    if _db_instance is not None:
-        _db_instance['cursor'].close()
-        _db_instance['conn'].close()
-        _db_instance = None
-
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
@@ -0,0 +1,71 @@
+import json
+import streamlit as st
+import instrumentation
+import query_cache
+import write_queue
+import photo_worker
+import session_lifecycle
+import gym_stats
+from repository import get_repository
+
+def is_admin(username):
+    return username in st.secrets.get("admins", [])
+
+# Admin-only view of query, page, cache, pool and write-queue timings for this process
+@instrumentation.timed_page
+def show_diagnostics_page():
+    st.header("Performance Diagnostics")
+    data = instrumentation.snapshot()
+    st.caption(f"Process uptime {data['uptime_seconds']}s · slow query threshold {data['slow_query_ms']:.0f} ms")
+
+    col1, col2 = st.columns(2)
+    col1.download_button("Export JSON", instrumentation.to_json(), file_name="climb_log_metrics.json", mime="application/json")
+    col2.download_button("Export Prometheus", instrumentation.to_prometheus(), file_name="climb_log_metrics.prom", mime="text/plain")
+
+    st.subheader("Page reruns")
+    st.dataframe(data['pages'], hide_index=True)
+
+    st.subheader("Statements")
+    st.dataframe([dict(s, call_sites=', '.join(s['call_sites'])) for s in data['statements']], hide_index=True)
+
+    st.subheader("Slow query log")
+    if data['slow_queries']:
+        st.dataframe(list(reversed(data['slow_queries'])), hide_index=True)
+    else:
+        st.write("No statements over the threshold yet.")
+
+    st.subheader("Query cache")
+    st.json(query_cache.stats())
+
+    st.subheader("Write queue")
+    st.json(write_queue.status())
+    # Queued writes the database rejected outright (e.g. a climb for a session that no longer exists)
+    dead_letters = write_queue.dead_letters()
+    if dead_letters:
+        st.caption("Rejected writes, kept in the queue file's dead_letters table")
+        st.dataframe([dict(d, payload=json.dumps(d['payload'])) for d in dead_letters], hide_index=True)
+
+    st.subheader("Photo worker")
+    st.json(photo_worker.status())
+
+    st.subheader("Session compaction")
+    st.json(session_lifecycle.status())
+
+    repo = get_repository()
+    if repo.name == 'postgres':
+        from db_singleton import pool_stats
+
+        st.subheader("Connection pool")
+        st.json(pool_stats())
+
+        import partitions
+
+        st.subheader("Gym aggregates and partitions")
+        st.json(gym_stats.status())
+        with repo.cursor() as (conn, c):
+            attached = partitions.attached_partitions(c)
+        st.caption(f"{len(attached)} monthly climbs partitions: " + ', '.join(name for _, name in sorted(attached.items())))
+
+    if st.button("Reset counters"):
+        instrumentation.reset()
+        st.rerun()
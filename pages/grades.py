@@ -0,0 +1,56 @@
+# The grade registry: every gym's scales and the integer grade codes derived from them. This module
+# is the only copy (there is no grades table); climbs store the grade_code computed here when written.
+# Grade scales, easiest to hardest. MBP circuits follow the gym's colour order.
+YDS_GRADES = ['5.6', '5.7', '5.8', '5.9', '5.10-', '5.10+', '5.11-', '5.11+', '5.12-', '5.12+']
+V_GRADES = ['VB', 'V1-2', 'V2-3', 'V4-5', 'V5-6', 'V7-8', 'V9-10', 'V11']
+MBP_CIRCUITS = ['Yellow', 'Red', 'Green', 'Purple', 'Orange', 'Black', 'Blue', 'Pink', 'White']
+
+# scale -> (code prefix, discipline, grades). A grade_code is prefix * 100 + ordinal, so
+# codes within one scale sort by difficulty and code // 100 recovers the scale.
+SCALES = {
+    'YDS': (1, 'Sport', YDS_GRADES),
+    'V': (2, 'Boulder', V_GRADES),
+    'Circuit': (3, 'Boulder', MBP_CIRCUITS),
+}
+
+GYM_SCALES = {
+    'VE Minneapolis': ['YDS', 'V'],
+    'VE Bloomington': ['YDS', 'V'],
+    'VE St.Paul': ['YDS', 'V'],
+    'VE TCB': ['V'],
+    'MBP': ['Circuit'],
+}
+
+GYM_NAMES = list(GYM_SCALES)
+
+# How a climb felt compared to its grade
+JUDGMENTS = ['Soft', 'On', 'Hard']
+
+SCALE_BY_PREFIX = {prefix: scale for scale, (prefix, _, _) in SCALES.items()}
+
+CODE_LABELS = {
+    prefix * 100 + ordinal: grade
+    for prefix, _, grades in SCALES.values()
+    for ordinal, grade in enumerate(grades, start=1)
+}
+
+def grade_options(gym_name):
+    return [grade for scale in GYM_SCALES.get(gym_name, []) for grade in SCALES[scale][2]]
+
+def _lookup(gym_name, grade):
+    for scale in GYM_SCALES.get(gym_name, []):
+        prefix, discipline, grades = SCALES[scale]
+        if grade in grades:
+            return scale, discipline, grades.index(grade) + 1, prefix * 100 + grades.index(grade) + 1
+    return None
+
+def encode_grade(gym_name, grade):
+    entry = _lookup(gym_name, grade)
+    return entry[3] if entry else None
+
+def discipline(gym_name, grade):
+    entry = _lookup(gym_name, grade)
+    return entry[1] if entry else None
+
+def scale_of(code):
+    return SCALE_BY_PREFIX.get(code // 100)
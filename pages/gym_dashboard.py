@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+import streamlit as st
+import plotly.express as px
+import pandas as pd
+import numpy as np
+import query_cache
+from instrumentation import timed_page
+from repository import get_repository, GYM_GRADE_COLUMNS, GYM_HOURLY_COLUMNS, GYM_LEVEL_COLUMNS, USER_TOP_COLUMNS
+from grades import CODE_LABELS, GYM_NAMES, SCALE_BY_PREFIX
+
+WINDOWS = {'3 months': 3, '6 months': 6, '12 months': 12}
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# Gym-wide reads are the same for every user, so they share one cache entry per gym and window
+def cached_gym_query(name, gym_name, since):
+    repo = get_repository()
+    return query_cache.cached(name, None, lambda: getattr(repo, name)(gym_name, since), gym_name, since)
+
+# Average sessions started per weekday and hour: totals divided by how often each weekday occurred
+def hourly_heatmap(rows, since, today):
+    df = pd.DataFrame(rows, columns=GYM_HOURLY_COLUMNS)
+    days = np.arange(np.datetime64(since), np.datetime64(today) + 1)
+    occurrences = np.bincount((days.astype(np.int64) + 3) % 7, minlength=7)
+    grid = np.zeros((7, 24))
+    np.add.at(grid, (df['weekday'].to_numpy(dtype=np.int64) - 1, df['hour'].to_numpy(dtype=np.int64)),
+              df['sessions'].to_numpy(dtype=float))
+    return pd.DataFrame(grid / np.maximum(occurrences, 1)[:, None], index=WEEKDAYS, columns=range(24))
+
+def grade_frame(rows):
+    df = pd.DataFrame(rows, columns=GYM_GRADE_COLUMNS)
+    df['grade'] = df['grade_code'].map(CODE_LABELS)
+    df['scale'] = (df['grade_code'] // 100).map(SCALE_BY_PREFIX)
+    df['unsent'] = df['climbs'] - df['sends']
+    return df
+
+# The gym's median and 90th percentile monthly top send next to the user's, per scale
+def progress_frame(level_rows, user_rows):
+    levels = pd.DataFrame(level_rows, columns=GYM_LEVEL_COLUMNS)
+    mine = pd.DataFrame(user_rows, columns=USER_TOP_COLUMNS)
+    df = levels.merge(mine, on=['month', 'scale_prefix'], how='left')
+    df['scale'] = df['scale_prefix'].map(SCALE_BY_PREFIX)
+    df = df.rename(columns={'median_top': 'gym median', 'p90_top': 'gym 90th percentile', 'top': 'you'})
+    for col in ['gym median', 'gym 90th percentile', 'you']:
+        df[col] = df[col].astype(float)
+    return df
+
+# Busiest hours, popular grades and how the user's progress compares with everyone at a gym
+@timed_page
+def show_gym_dashboard_page():
+    username = st.session_state['username']
+    st.header("Gym Dashboards")
+
+    col1, col2 = st.columns(2)
+    gym_name = col1.selectbox("Gym", GYM_NAMES)
+    months = WINDOWS[col2.radio("Window", list(WINDOWS), horizontal=True)]
+    today = date.today()
+    since = today - timedelta(days=30 * months)
+
+    hourly = cached_gym_query('gym_hourly', gym_name, since)
+    if not hourly:
+        st.write("No sessions logged at this gym in this window yet.")
+        return
+
+    st.subheader("Busiest hours")
+    fig_hours = px.imshow(hourly_heatmap(hourly, since, today), aspect='auto', color_continuous_scale='Blues',
+                          labels={'x': 'Hour', 'y': 'Day', 'color': 'Sessions started'})
+    st.plotly_chart(fig_hours)
+
+    grades = grade_frame(cached_gym_query('gym_grades', gym_name, since))
+    if not grades.empty:
+        st.subheader("Popular grades")
+        fig_grades = px.bar(grades, x='grade', y=['sends', 'unsent'], facet_col='scale',
+                            labels={'value': 'Climbs', 'grade': 'Grade', 'variable': ''})
+        fig_grades.update_xaxes(matches=None, categoryorder='array', categoryarray=grades['grade'])
+        st.plotly_chart(fig_grades)
+
+    levels = cached_gym_query('gym_levels', gym_name, since)
+    if levels:
+        st.subheader("Your progress against the gym")
+        repo = get_repository()
+        user_tops = query_cache.cached('user_monthly_tops', username,
+                                       lambda: repo.user_monthly_tops(username, gym_name, since), gym_name, since)
+        progress = progress_frame(levels, user_tops)
+        for prefix, scale_progress in progress.groupby('scale_prefix'):
+            fig_progress = px.line(scale_progress, x='month', y=['gym median', 'gym 90th percentile', 'you'],
+                                   markers=True, title=f"Hardest monthly send ({SCALE_BY_PREFIX[prefix]})",
+                                   labels={'value': 'Grade', 'month': 'Month', 'variable': ''})
+            ordinals = sorted(code % 100 for code in CODE_LABELS if code // 100 == prefix)
+            fig_progress.update_yaxes(tickvals=ordinals, ticktext=[CODE_LABELS[prefix * 100 + o] for o in ordinals])
+            st.plotly_chart(fig_progress)
+        st.caption("Gym lines are across every climber who sent something here that month.")
@@ -0,0 +1,144 @@
+import argparse
+import threading
+import time
+from datetime import date
+import streamlit as st
+import partitions
+
+# Gym-wide aggregates for the Gyms dashboard, across all users. Refreshing a recent window
+# only reads the climbs partitions in that window; older rows are left as they were, so they
+# survive their partitions being detached. The same job keeps future partitions created.
+DEFAULT_INTERVAL_MINUTES = 60
+# A failed run is retried sooner than the next regular refresh
+RETRY_SECONDS = 60
+# Every app process runs the maintainer; this key lets only one of them work at a time
+MAINTENANCE_LOCK_ID = 7420191
+
+_maintainer = None
+_status = {'runs': 0, 'skipped': 0, 'last_run': None, 'last_report': None, 'last_error': None}
+
+def _config():
+    return st.secrets.get("gym_stats", {})
+
+# Recompute the aggregates from since (a date) onwards, or everything when since is None
+def refresh(c, since=None):
+    month = partitions.month_start(since) if since else None
+    params = {'since': since, 'month': month}
+    c.execute("DELETE FROM gym_hourly_stats WHERE %(since)s::date IS NULL OR day >= %(since)s", params)
+    c.execute("""
+        INSERT INTO gym_hourly_stats (gym_name, day, hour, sessions, climbers, minutes)
+        SELECT gym_name, start_time::date, EXTRACT(HOUR FROM start_time)::int,
+               COUNT(*), COUNT(DISTINCT username), COALESCE(SUM(duration), 0) / 60.0
+        FROM sessions
+        WHERE state <> 'draft' AND gym_name IS NOT NULL AND start_time IS NOT NULL
+          AND (%(since)s::date IS NULL OR start_time >= %(since)s)
+        GROUP BY 1, 2, 3
+    """, params)
+    hourly = c.rowcount
+
+    c.execute("DELETE FROM gym_grade_stats WHERE %(month)s::date IS NULL OR month >= %(month)s", params)
+    c.execute("""
+        INSERT INTO gym_grade_stats (gym_name, month, grade_code, climbs, sends, climbers, attempts)
+        SELECT climbs.gym_name, date_trunc('month', climbs.climb_date)::date, climbs.grade_code,
+               COUNT(*), COUNT(*) FILTER (WHERE climbs.sent), COUNT(DISTINCT sessions.username),
+               COALESCE(SUM(climbs.num_attempts), 0)
+        FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+        WHERE climbs.grade_code IS NOT NULL AND climbs.gym_name IS NOT NULL
+          AND (%(month)s::date IS NULL OR climbs.climb_date >= %(month)s)
+        GROUP BY 1, 2, 3
+    """, params)
+    grades = c.rowcount
+
+    # Each climber's hardest send per gym, month and scale, summarised across climbers
+    c.execute("DELETE FROM gym_monthly_levels WHERE %(month)s::date IS NULL OR month >= %(month)s", params)
+    c.execute("""
+        INSERT INTO gym_monthly_levels (gym_name, month, scale_prefix, climbers, median_top, p90_top)
+        SELECT gym_name, month, scale_prefix, COUNT(*),
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY top),
+               percentile_cont(0.9) WITHIN GROUP (ORDER BY top)
+        FROM (
+            SELECT climbs.gym_name, date_trunc('month', climbs.climb_date)::date AS month,
+                   climbs.grade_code / 100 AS scale_prefix, sessions.username, MAX(climbs.grade_code %% 100) AS top
+            FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+            WHERE climbs.sent AND climbs.grade_code IS NOT NULL AND climbs.gym_name IS NOT NULL
+              AND (%(month)s::date IS NULL OR climbs.climb_date >= %(month)s)
+            GROUP BY 1, 2, 3, 4
+        ) tops
+        GROUP BY 1, 2, 3
+    """, params)
+    levels = c.rowcount
+    return {'hourly_rows': hourly, 'grade_rows': grades, 'level_rows': levels}
+
+# Create upcoming partitions, detach expired ones if a retention is set, refresh recent aggregates.
+# Returns None when another process holds the lock; it is doing the same work.
+def maintain(conn, c, today=None):
+    # Transaction-scoped, so the commit (or a rollback on error) releases it
+    c.execute("SELECT pg_try_advisory_xact_lock(%s)", (MAINTENANCE_LOCK_ID,))
+    if not c.fetchone()[0]:
+        conn.rollback()
+        return None
+    today = today or date.today()
+    config = _config()
+    report = {'created_partitions': partitions.ensure_partitions(
+        c, int(config.get("months_ahead", partitions.MONTHS_AHEAD)), today=today)}
+    if config.get("retain_months"):
+        report['detached_partitions'] = partitions.detach_partitions(c, int(config["retain_months"]), today=today)
+    # The previous month still changes while late climbs are logged and sessions end
+    report.update(refresh(c, partitions.add_months(partitions.month_start(today), -1)))
+    conn.commit()
+    return report
+
+def _run(repo, interval):
+    while True:
+        try:
+            with repo.cursor() as (conn, c):
+                report = maintain(conn, c)
+            if report is None:
+                _status['skipped'] += 1
+            else:
+                _status['last_report'] = report
+                _status['runs'] += 1
+                _status['last_run'] = time.time()
+            _status['last_error'] = None
+            time.sleep(interval)
+        except Exception as e:
+            _status['last_error'] = str(e)
+            time.sleep(min(interval, RETRY_SECONDS))
+
+# Only the Postgres backend has partitions and precomputed aggregates
+def start_maintainer(repo):
+    global _maintainer
+    if repo.name != 'postgres':
+        return
+    if _maintainer is None or not _maintainer.is_alive():
+        interval = float(_config().get("refresh_minutes", DEFAULT_INTERVAL_MINUTES)) * 60
+        _maintainer = threading.Thread(target=_run, args=(repo, interval), name='climb-gym-stats', daemon=True)
+        _maintainer.start()
+
+def status():
+    return dict(_status)
+
+if __name__ == '__main__':
+    from db_singleton import db_cursor
+    from migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Maintain climbs partitions and refresh the gym aggregates")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute the aggregates for all history")
+    parser.add_argument('--partitions', action='store_true', help="List the attached climbs partitions")
+    args = parser.parse_args()
+    with db_cursor() as (conn, c):
+        run_migrations(conn, c)
+        if args.partitions:
+            for month, name in sorted(partitions.attached_partitions(c).items()):
+                print(f"{month:%Y-%m}  {name}")
+        elif args.rebuild:
+            report = refresh(c)
+            conn.commit()
+            print(', '.join(f"{name.replace('_', ' ')}: {rows}" for name, rows in report.items()))
+        else:
+            report = maintain(conn, c)
+            if report is None:
+                print("Another process is running maintenance; try again later.")
+            else:
+                for name, value in report.items():
+                    print(f"{name.replace('_', ' ')}: {value}")
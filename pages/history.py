@@ -0,0 +1,54 @@
+import streamlit as st
+import query_cache
+from instrumentation import timed_page
+from repository import get_repository, SEARCH_COLUMNS
+from grades import GYM_NAMES, grade_options as gym_grade_options, CODE_LABELS
+
+PAGE_SIZE = 25
+ALL = 'All'
+SENT_OPTIONS = {ALL: None, 'Sent': True, 'Not sent': False}
+
+# Search and browse every climb the user has logged, a page at a time
+@timed_page
+def show_history_page():
+    username = st.session_state['username']
+    repo = get_repository()
+    st.header("Climb History")
+
+    query = st.text_input("Search climb names and notes", placeholder="e.g. overhang project")
+    col1, col2, col3 = st.columns(3)
+    gym_name = col1.selectbox("Gym", [ALL] + GYM_NAMES)
+    grades = gym_grade_options(gym_name) if gym_name != ALL else list(dict.fromkeys(CODE_LABELS.values()))
+    grade = col2.selectbox("Grade", [ALL] + grades)
+    sent = col3.radio("Sent", list(SENT_OPTIONS), horizontal=True)
+    filters = (query.strip(), None if gym_name == ALL else gym_name, None if grade == ALL else grade, SENT_OPTIONS[sent])
+
+    # Each page starts after the (climb_date, id) of the previous page's last row
+    if st.session_state.get('history_filters') != filters:
+        st.session_state['history_filters'] = filters
+        st.session_state['history_pages'] = [None]
+    after = st.session_state['history_pages'][-1]
+
+    # One extra row tells whether there is a next page
+    rows = query_cache.cached('search_climbs', username,
+                              lambda: repo.search_climbs(username, *filters, after=after, limit=PAGE_SIZE + 1),
+                              filters, after)
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+
+    page_number = len(st.session_state['history_pages'])
+    if not rows:
+        st.write("No climbs match." if page_number == 1 else "No more climbs.")
+    else:
+        st.dataframe([dict(zip(SEARCH_COLUMNS, row)) for row in rows], hide_index=True, use_container_width=True,
+                     column_order=SEARCH_COLUMNS[1:])
+
+    col1, col2, col3 = st.columns([1, 1, 4])
+    if col1.button("Newer", disabled=page_number == 1):
+        st.session_state['history_pages'].pop()
+        st.rerun()
+    if col2.button("Older", disabled=not has_more):
+        last = dict(zip(SEARCH_COLUMNS, rows[-1]))
+        st.session_state['history_pages'].append((last['climb_date'], last['id']))
+        st.rerun()
+    col3.caption(f"Page {page_number}")
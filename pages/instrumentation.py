@@ -0,0 +1,212 @@
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+import streamlit as st
+
+# Process-wide timing of database statements and page functions, shown on the admin
+# Diagnostics page. Cursors are wrapped in InstrumentedCursor; page functions use @timed_page.
+DEFAULT_SLOW_QUERY_MS = 200
+RECENT_SAMPLES = 500
+
+# Frames in these files are plumbing; the call site is the first frame outside them
+_PLUMBING = ('instrumentation.py', 'contextlib.py', 'extras.py', 'repository.py', 'db_singleton.py',
+             'query_cache.py', 'rollups.py')
+
+_lock = threading.Lock()
+_statements = {}
+_slow_log = deque(maxlen=RECENT_SAMPLES)
+_pages = {}
+_started = time.time()
+_threshold_ms = None
+
+def slow_query_threshold_ms():
+    global _threshold_ms
+    if _threshold_ms is None:
+        _threshold_ms = float(st.secrets.get("diagnostics", {}).get("slow_query_ms", DEFAULT_SLOW_QUERY_MS))
+    return _threshold_ms
+
+def _normalize(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors='replace')
+    sql = ' '.join(str(sql).split())
+    # Multi-row VALUES lists differ per batch size; keep them under one key
+    values_at = sql.upper().find(' VALUES (')
+    if values_at != -1 and sql.count('(', values_at) > 1:
+        sql = sql[:values_at] + ' VALUES (...)' + sql[sql.rfind(')') + 1:]
+    return sql[:300]
+
+def _call_site():
+    frame = sys._getframe(1)
+    site = None
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _PLUMBING:
+            site = f"{filename}:{frame.f_lineno} {frame.f_code.co_name}"
+            break
+        frame = frame.f_back
+    return site or 'unknown'
+
+def record_statement(sql, elapsed_ms, rows):
+    key = _normalize(sql)
+    site = _call_site()
+    with _lock:
+        entry = _statements.setdefault(key, {'statement': key, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                             'rows': 0, 'call_sites': set()})
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['rows'] += max(rows or 0, 0)
+        entry['call_sites'].add(site)
+        if elapsed_ms >= slow_query_threshold_ms():
+            _slow_log.append({'at': time.time(), 'statement': key, 'ms': round(elapsed_ms, 2), 'rows': rows, 'call_site': site})
+
+@contextmanager
+def _timed_statement(sql, rowcount):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_statement(sql, (time.perf_counter() - started) * 1000, rowcount())
+
+# Drop-in cursor proxy: times execute/executemany/copy_expert and passes everything else through
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=None):
+        with _timed_statement(sql, lambda: self._cursor.rowcount):
+            return self._cursor.execute(sql, params)
+
+    def executemany(self, sql, params):
+        with _timed_statement(sql, lambda: self._cursor.rowcount):
+            return self._cursor.executemany(sql, params)
+
+    def copy_expert(self, sql, file, *args, **kwargs):
+        with _timed_statement(sql, lambda: self._cursor.rowcount):
+            return self._cursor.copy_expert(sql, file, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+# Same idea for sqlite3 connections, whose execute* methods live on the connection
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, sql, params=()):
+        cursor = None
+        with _timed_statement(sql, lambda: cursor.rowcount if cursor is not None else None):
+            cursor = self._conn.execute(sql, params)
+        return cursor
+
+    def executemany(self, sql, params):
+        cursor = None
+        with _timed_statement(sql, lambda: cursor.rowcount if cursor is not None else None):
+            cursor = self._conn.executemany(sql, params)
+        return cursor
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def record_page(name, elapsed_ms):
+    with _lock:
+        entry = _pages.setdefault(name, {'page': name, 'runs': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                         'recent': deque(maxlen=RECENT_SAMPLES)})
+        entry['runs'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['recent'].append(elapsed_ms)
+
+@contextmanager
+def timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        # Also runs when st.rerun()/st.stop() end the page early
+        record_page(name, (time.perf_counter() - started) * 1000)
+
+def timed_page(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with timer(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def snapshot():
+    with _lock:
+        statements = [
+            dict(entry, call_sites=sorted(entry['call_sites']), total_ms=round(entry['total_ms'], 2),
+                 max_ms=round(entry['max_ms'], 2), avg_ms=round(entry['total_ms'] / entry['calls'], 2))
+            for entry in _statements.values()
+        ]
+        pages = [
+            {'page': entry['page'], 'runs': entry['runs'], 'avg_ms': round(entry['total_ms'] / entry['runs'], 2),
+             'p50_ms': round(statistics.median(entry['recent']), 2),
+             'p95_ms': round(_percentile(entry['recent'], 0.95), 2), 'max_ms': round(entry['max_ms'], 2)}
+            for entry in _pages.values()
+        ]
+        slow = list(_slow_log)
+    statements.sort(key=lambda entry: entry['total_ms'], reverse=True)
+    return {'uptime_seconds': round(time.time() - _started), 'slow_query_ms': slow_query_threshold_ms(),
+            'statements': statements, 'pages': pages, 'slow_queries': slow}
+
+def to_json():
+    return json.dumps(snapshot(), indent=2, default=str)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+# Prometheus text exposition format
+def to_prometheus():
+    data = snapshot()
+    lines = [
+        '# HELP climb_log_query_calls_total Statements executed.',
+        '# TYPE climb_log_query_calls_total counter',
+    ]
+    lines += [f'climb_log_query_calls_total{{statement="{_label(s["statement"][:120])}"}} {s["calls"]}' for s in data['statements']]
+    lines += ['# HELP climb_log_query_seconds_total Time spent in statements.', '# TYPE climb_log_query_seconds_total counter']
+    lines += [f'climb_log_query_seconds_total{{statement="{_label(s["statement"][:120])}"}} {s["total_ms"] / 1000:.6f}' for s in data['statements']]
+    lines += ['# HELP climb_log_page_runs_total Page function runs.', '# TYPE climb_log_page_runs_total counter']
+    lines += [f'climb_log_page_runs_total{{page="{_label(p["page"])}"}} {p["runs"]}' for p in data['pages']]
+    lines += ['# HELP climb_log_page_seconds Page function run time.', '# TYPE climb_log_page_seconds summary']
+    for p in data['pages']:
+        lines.append(f'climb_log_page_seconds{{page="{_label(p["page"])}",quantile="0.5"}} {p["p50_ms"] / 1000:.6f}')
+        lines.append(f'climb_log_page_seconds{{page="{_label(p["page"])}",quantile="0.95"}} {p["p95_ms"] / 1000:.6f}')
+        lines.append(f'climb_log_page_seconds_sum{{page="{_label(p["page"])}"}} {p["avg_ms"] * p["runs"] / 1000:.6f}')
+        lines.append(f'climb_log_page_seconds_count{{page="{_label(p["page"])}"}} {p["runs"]}')
+    lines += ['# HELP climb_log_slow_queries Slow statements currently in the log.', '# TYPE climb_log_slow_queries gauge',
+              f'climb_log_slow_queries {len(data["slow_queries"])}']
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _slow_log.clear()
+        _pages.clear()
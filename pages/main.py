@@ -1,12 +1,23 @@
 import hmac
 import streamlit as st
-from datetime import datetime
-import base64
 import hashlib
 import session
-from db_singleton import get_db, create_tables_if_not_exist, close_db, drop_tables
-from analytics import show_analytics_page
-import os
+from repository import get_repository
+import write_queue
+import photo_worker
+import session_lifecycle
+import gym_stats
+import query_cache
+from diagnostics import is_admin
+import instrumentation
+from assets import inject_styles
+
+# Must be the first Streamlit command of every rerun
+st.set_page_config(
+    page_title="Climbing Analytics Dashboard",
+    page_icon="🧗",
+    layout="wide",
+)
 
 # Function to hash a password
 def hash_password(password):
@@ -53,13 +64,20 @@ def check_password():
 if not check_password():
     st.stop()
 
-# Get the database instance and cursor
-db_instance = get_db()
-conn, c = db_instance['conn'], db_instance['cursor']
+# Storage backend chosen in secrets; apply pending schema migrations once per process
+repo = get_repository()
+repo.migrate()
 
-# Create tables if they don't exist
-create_tables_if_not_exist(c, conn)
-#close_db()
+# Background thread that drains the local write queue into the database;
+# cached reads for a user are invalidated once their queued writes land
+write_queue.add_flush_listener(query_cache.bump_versions)
+write_queue.start_flusher()
+# Pick up photo uploads a previous process stopped before processing (once per process)
+photo_worker.resume_pending(repo)
+# Periodically close stale sessions and purge ones that never got a climb
+session_lifecycle.start_compactor(repo)
+# Keep future climbs partitions created and the gym dashboard aggregates fresh (Postgres only)
+gym_stats.start_maintainer(repo)
 
 # Initialize session state
 def initialize_session_state():
@@ -78,43 +96,40 @@ initialize_session_state()
 
 # Sidebar for Logout and Toggle between Start Session and Analytics
 with st.sidebar:
-    page_options = ['Session', 'Analytics']
+    page_options = ['Session', 'Analytics', 'History', 'Gyms']
+    if is_admin(st.session_state.get('username')):
+        page_options.append('Diagnostics')
+    if st.session_state.get('page') not in page_options:
+        st.session_state['page'] = 'Session'
     st.session_state['page'] = st.radio("Choose Page", page_options, index=page_options.index(st.session_state.get('page', 'Session')))
 
-if st.session_state['page'] == 'Session':
-    username = st.session_state.get("username", None)
-    if username:
-        session.app(conn, c, username)
-    else:
-        st.error("Username not found. Please log in again.")
-elif st.session_state['page'] == 'Analytics':
-    show_analytics_page()
-
-import os
+    # Writes queued locally that have not reached the database yet
+    queue_status = write_queue.status()
+    st.caption(f"Pending writes: {queue_status['pending']}")
+    if queue_status['last_error']:
+        st.caption(f"Database unreachable, retrying: {queue_status['last_error']}")
 
-# Set the background image
-def set_background_image(image_path, image_extension):
-    try:
-        # Open the image file
-        with open(image_path, "rb") as f:
-            base64_image = base64.b64encode(f.read()).decode()
-        
-        # Set the background image
-        st.markdown(
-            f"""
-            <style>
-            .stApp {{
-                background: url(data:image/{image_extension};base64,{base64_image});
-                background-size: cover;
-            }}
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
-    except FileNotFoundError:
-        st.error(f"File {image_path} not found.")
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
+# Wall-clock time of the page part of each rerun, shown on the Diagnostics page
+with instrumentation.timer('rerun'):
+    if st.session_state['page'] == 'Session':
+        username = st.session_state.get("username", None)
+        if username:
+            session.app(repo, username)
+        else:
+            st.error("Username not found. Please log in again.")
+    elif st.session_state['page'] == 'Analytics':
+        # pandas, NumPy and plotly are only imported once someone opens Analytics
+        from analytics import show_analytics_page
+        show_analytics_page()
+    elif st.session_state['page'] == 'History':
+        from history import show_history_page
+        show_history_page()
+    elif st.session_state['page'] == 'Gyms':
+        from gym_dashboard import show_gym_dashboard_page
+        show_gym_dashboard_page()
+    elif st.session_state['page'] == 'Diagnostics':
+        from diagnostics import show_diagnostics_page
+        show_diagnostics_page()
 
-# Call the function
-set_background_image("background.jpg", "jpg")
+# Background image and slider styles, served from pages/static/
+inject_styles()
@@ -0,0 +1,361 @@
+import argparse
+import threading
+from datetime import date
+
+# Ordered schema migrations as (version, name, statements). A statement is SQL text or a
+# callable taking the cursor, for data steps. Each migration runs once, in its own
+# transaction, and is recorded in schema_version. Never edit an applied migration; add a new one.
+# Data steps are defined in this file and use only their own constants, so later changes to the
+# app's modules can't change what an applied migration did.
+
+# Grade registry as of migration 3: scale -> (code prefix, discipline, grades), gym -> scales
+_V3_SCALES = {
+    'YDS': (1, 'Sport', ['5.6', '5.7', '5.8', '5.9', '5.10-', '5.10+', '5.11-', '5.11+', '5.12-', '5.12+']),
+    'V': (2, 'Boulder', ['VB', 'V1-2', 'V2-3', 'V4-5', 'V5-6', 'V7-8', 'V9-10', 'V11']),
+    'Circuit': (3, 'Boulder', ['Yellow', 'Red', 'Green', 'Purple', 'Orange', 'Black', 'Blue', 'Pink', 'White']),
+}
+_V3_GYM_SCALES = {
+    'VE Minneapolis': ['YDS', 'V'],
+    'VE Bloomington': ['YDS', 'V'],
+    'VE St.Paul': ['YDS', 'V'],
+    'VE TCB': ['V'],
+    'MBP': ['Circuit'],
+}
+
+# Upsert the registry and backfill climbs.grade_code from it
+def _seed_grade_registry_v3(c):
+    rows = [(gym_name, grade, scale, discipline, ordinal, prefix * 100 + ordinal)
+            for gym_name, scales in _V3_GYM_SCALES.items()
+            for scale in scales
+            for prefix, discipline, grades in [_V3_SCALES[scale]]
+            for ordinal, grade in enumerate(grades, start=1)]
+    c.executemany("""
+        INSERT INTO grades (gym_name, grade, scale, discipline, ordinal, grade_code)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (gym_name, grade) DO UPDATE SET
+            scale = EXCLUDED.scale,
+            discipline = EXCLUDED.discipline,
+            ordinal = EXCLUDED.ordinal,
+            grade_code = EXCLUDED.grade_code
+    """, rows)
+    c.execute("""
+        UPDATE climbs SET grade_code = grades.grade_code
+        FROM grades
+        WHERE climbs.gym_name = grades.gym_name
+          AND climbs.grade = grades.grade
+          AND climbs.grade_code IS DISTINCT FROM grades.grade_code
+    """)
+
+def _add_months_v8(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+# Rebuild climbs as a table range-partitioned by month on climb_date, with the same columns,
+# ids and indexes: climbs_pYYYYMM from the oldest climb to 3 months ahead, plus climbs_default
+def _partition_climbs_v8(c):
+    c.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('climbs')")
+    if c.fetchone()[0] == 'p':
+        return
+    c.execute("""UPDATE climbs SET climb_date = COALESCE(
+                     (SELECT start_time::date FROM sessions WHERE sessions.session_id = climbs.session_id), CURRENT_DATE)
+                 WHERE climb_date IS NULL""")
+    c.execute("SELECT pg_get_serial_sequence('climbs', 'id')")
+    sequence = c.fetchone()[0]
+    # Keep the id sequence alive when the old table is dropped
+    c.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    c.execute("ALTER TABLE climbs RENAME TO climbs_unpartitioned")
+    c.execute("""CREATE TABLE climbs
+                 (LIKE climbs_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE)
+                 PARTITION BY RANGE (climb_date)""")
+    c.execute("ALTER TABLE climbs ALTER COLUMN climb_date SET NOT NULL")
+    c.execute("CREATE TABLE climbs_default PARTITION OF climbs DEFAULT")
+    # Months are created before the copy so every row goes straight to its partition
+    c.execute("SELECT MIN(climb_date) FROM climbs_unpartitioned")
+    today = date.today()
+    first = c.fetchone()[0] or today
+    month, last = date(first.year, first.month, 1), _add_months_v8(date(today.year, today.month, 1), 3)
+    while month <= last:
+        c.execute(f"CREATE TABLE climbs_p{month:%Y%m} PARTITION OF climbs FOR VALUES FROM (%s) TO (%s)",
+                  (month, _add_months_v8(month, 1)))
+        month = _add_months_v8(month, 1)
+
+    # Every column but generated ones such as search_vector
+    c.execute("""SELECT column_name FROM information_schema.columns
+                 WHERE table_schema = current_schema() AND table_name = 'climbs' AND is_generated = 'NEVER'
+                 ORDER BY ordinal_position""")
+    columns = ', '.join(row[0] for row in c.fetchall())
+    c.execute(f"INSERT INTO climbs ({columns}) SELECT {columns} FROM climbs_unpartitioned")
+    c.execute("DROP TABLE climbs_unpartitioned")
+    c.execute(f"ALTER SEQUENCE {sequence} OWNED BY climbs.id")
+    c.execute("ALTER TABLE climbs ADD PRIMARY KEY (id, climb_date)")
+    c.execute("ALTER TABLE climbs ADD FOREIGN KEY (session_id) REFERENCES sessions (session_id)")
+    for statement in [
+        'CREATE INDEX IF NOT EXISTS climbs_session_id_idx ON climbs (session_id)',
+        'CREATE INDEX IF NOT EXISTS climbs_sent_grade_code_idx ON climbs (session_id, grade_code) WHERE sent',
+        # Unique indexes on a partitioned table must include the partition key
+        'CREATE UNIQUE INDEX IF NOT EXISTS climbs_client_id_idx ON climbs (client_id, climb_date)',
+        'CREATE INDEX IF NOT EXISTS climbs_search_vector_idx ON climbs USING gin (search_vector)',
+        'CREATE INDEX IF NOT EXISTS climbs_climb_name_trgm_idx ON climbs USING gin (climb_name gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS climbs_climb_date_id_idx ON climbs (climb_date DESC, id DESC)',
+    ]:
+        c.execute(statement)
+
+MIGRATIONS = [
+    (1, 'base tables', [
+        '''CREATE TABLE IF NOT EXISTS sessions
+           (session_id SERIAL PRIMARY KEY,
+           username TEXT,
+           start_time TIMESTAMP,
+           end_time TIMESTAMP,
+           gym_name TEXT,
+           duration INTEGER)''',
+        '''CREATE TABLE IF NOT EXISTS climbs
+           (id SERIAL PRIMARY KEY,
+           session_id INTEGER,
+           photo BYTEA,
+           climb_date DATE,
+           climb_name TEXT,
+           gym_name TEXT,
+           grade TEXT,
+           grade_judgment TEXT,
+           num_attempts INTEGER,
+           sent BOOLEAN,
+           notes TEXT,
+           star_rating INT,
+           type TEXT,
+           FOREIGN KEY(session_id) REFERENCES sessions(session_id))''',
+        # Photos live in the blob store; climbs only keeps the key and metadata
+        '''ALTER TABLE climbs
+           ADD COLUMN IF NOT EXISTS photo_key TEXT,
+           ADD COLUMN IF NOT EXISTS photo_width INTEGER,
+           ADD COLUMN IF NOT EXISTS photo_height INTEGER,
+           ADD COLUMN IF NOT EXISTS photo_size INTEGER''',
+        # Immutable summary of each finished session, written when it ends
+        '''CREATE TABLE IF NOT EXISTS session_summaries
+           (session_id INTEGER PRIMARY KEY REFERENCES sessions(session_id),
+           total_climbs INTEGER,
+           top_grade TEXT,
+           top_grade_count INTEGER,
+           avg_attempts NUMERIC,
+           start_time TIMESTAMP,
+           end_time TIMESTAMP,
+           climbs JSONB)''',
+        # Weekly per-user totals for the Analytics page, keyed by ISO year and week
+        '''CREATE TABLE IF NOT EXISTS weekly_rollups
+           (username TEXT,
+           iso_year INTEGER,
+           iso_week INTEGER,
+           total_minutes NUMERIC DEFAULT 0,
+           climb_count INTEGER DEFAULT 0,
+           sends INTEGER DEFAULT 0,
+           grade_histogram JSONB DEFAULT '{}'::jsonb,
+           PRIMARY KEY (username, iso_year, iso_week))''',
+    ]),
+    (2, 'indexes for session and analytics lookups', [
+        # Summary, rollup rebuild and the analytics join all look climbs up by session
+        'CREATE INDEX IF NOT EXISTS climbs_session_id_idx ON climbs (session_id)',
+        # Analytics filters sessions by user and orders them by start time
+        'CREATE INDEX IF NOT EXISTS sessions_username_start_time_idx ON sessions (username, start_time DESC)',
+    ]),
+    (3, 'grade registry and integer grade codes', [
+        '''CREATE TABLE IF NOT EXISTS grades
+           (gym_name TEXT,
+           grade TEXT,
+           scale TEXT NOT NULL,
+           discipline TEXT NOT NULL,
+           ordinal SMALLINT NOT NULL,
+           grade_code SMALLINT NOT NULL,
+           PRIMARY KEY (gym_name, grade))''',
+        'ALTER TABLE climbs ADD COLUMN IF NOT EXISTS grade_code SMALLINT',
+        _seed_grade_registry_v3,
+        # Send statistics (pyramid, hardest send, average difficulty) read only sent climbs
+        'CREATE INDEX IF NOT EXISTS climbs_sent_grade_code_idx ON climbs (session_id, grade_code) WHERE sent',
+    ]),
+    (4, 'client ids for idempotent queued climb inserts', [
+        'ALTER TABLE climbs ADD COLUMN IF NOT EXISTS client_id UUID',
+        'CREATE UNIQUE INDEX IF NOT EXISTS climbs_client_id_idx ON climbs (client_id)',
+    ]),
+    (5, 'photo processing status and thumbnails', [
+        # pending until the photo worker has re-encoded the upload, then ready or failed
+        '''ALTER TABLE climbs
+           ADD COLUMN IF NOT EXISTS photo_status TEXT,
+           ADD COLUMN IF NOT EXISTS photo_thumb_key TEXT''',
+        """UPDATE climbs SET photo_status = 'ready' WHERE photo_key IS NOT NULL AND photo_status IS NULL""",
+    ]),
+    (6, 'session lifecycle states', [
+        # The app inserts drafts explicitly; bulk loads (history, climb_io) only write finished sessions
+        '''ALTER TABLE sessions ADD COLUMN IF NOT EXISTS state TEXT NOT NULL DEFAULT 'ended'
+           CHECK (state IN ('draft', 'active', 'ended'))''',
+        # Sessions left open so far: active if anything was logged in them, otherwise drafts
+        '''UPDATE sessions SET state = CASE
+               WHEN EXISTS (SELECT 1 FROM climbs WHERE climbs.session_id = sessions.session_id) THEN 'active'
+               ELSE 'draft' END
+           WHERE end_time IS NULL''',
+        # The stale-session sweep and compaction only look at sessions that are still open
+        "CREATE INDEX IF NOT EXISTS sessions_open_start_time_idx ON sessions (start_time) WHERE state <> 'ended'",
+    ]),
+    (7, 'climb search and history pagination', [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        # Names weigh more than notes; the gym name lets "overhang st.paul" match too
+        '''ALTER TABLE climbs ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+               setweight(to_tsvector('english', coalesce(climb_name, '')), 'A') ||
+               setweight(to_tsvector('english', coalesce(notes, '')), 'B') ||
+               setweight(to_tsvector('simple', coalesce(gym_name, '')), 'C')) STORED''',
+        'CREATE INDEX IF NOT EXISTS climbs_search_vector_idx ON climbs USING gin (search_vector)',
+        # Partial words and typos in climb names
+        'CREATE INDEX IF NOT EXISTS climbs_climb_name_trgm_idx ON climbs USING gin (climb_name gin_trgm_ops)',
+        # History pages walk climbs newest first and continue from the last (climb_date, id) seen
+        'CREATE INDEX IF NOT EXISTS climbs_climb_date_id_idx ON climbs (climb_date DESC, id DESC)',
+    ]),
+    (8, 'monthly climb partitions and gym aggregates', [
+        # climbs becomes range-partitioned on climb_date; partitions.py maintains it afterwards
+        _partition_climbs_v8,
+        # sessions stays one table (climbs and session_summaries reference its key); gym-wide
+        # scans filter it by start time instead
+        'CREATE INDEX IF NOT EXISTS sessions_start_time_idx ON sessions (start_time)',
+        # Cross-user aggregates behind the Gyms dashboard, refreshed by gym_stats
+        '''CREATE TABLE IF NOT EXISTS gym_hourly_stats
+           (gym_name TEXT,
+           day DATE,
+           hour SMALLINT,
+           sessions INTEGER,
+           climbers INTEGER,
+           minutes NUMERIC,
+           PRIMARY KEY (gym_name, day, hour))''',
+        '''CREATE TABLE IF NOT EXISTS gym_grade_stats
+           (gym_name TEXT,
+           month DATE,
+           grade_code SMALLINT,
+           climbs INTEGER,
+           sends INTEGER,
+           climbers INTEGER,
+           attempts INTEGER,
+           PRIMARY KEY (gym_name, month, grade_code))''',
+        # Median and 90th percentile of climbers' hardest monthly send, as grade ordinals
+        '''CREATE TABLE IF NOT EXISTS gym_monthly_levels
+           (gym_name TEXT,
+           month DATE,
+           scale_prefix SMALLINT,
+           climbers INTEGER,
+           median_top NUMERIC,
+           p90_top NUMERIC,
+           PRIMARY KEY (gym_name, month, scale_prefix))''',
+        # First fill of the aggregates over all history; gym_stats keeps recent months fresh
+        '''INSERT INTO gym_hourly_stats (gym_name, day, hour, sessions, climbers, minutes)
+           SELECT gym_name, start_time::date, EXTRACT(HOUR FROM start_time)::int,
+                  COUNT(*), COUNT(DISTINCT username), COALESCE(SUM(duration), 0) / 60.0
+           FROM sessions
+           WHERE state <> 'draft' AND gym_name IS NOT NULL AND start_time IS NOT NULL
+           GROUP BY 1, 2, 3''',
+        '''INSERT INTO gym_grade_stats (gym_name, month, grade_code, climbs, sends, climbers, attempts)
+           SELECT climbs.gym_name, date_trunc('month', climbs.climb_date)::date, climbs.grade_code,
+                  COUNT(*), COUNT(*) FILTER (WHERE climbs.sent), COUNT(DISTINCT sessions.username),
+                  COALESCE(SUM(climbs.num_attempts), 0)
+           FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+           WHERE climbs.grade_code IS NOT NULL AND climbs.gym_name IS NOT NULL
+           GROUP BY 1, 2, 3''',
+        '''INSERT INTO gym_monthly_levels (gym_name, month, scale_prefix, climbers, median_top, p90_top)
+           SELECT gym_name, month, scale_prefix, COUNT(*),
+                  percentile_cont(0.5) WITHIN GROUP (ORDER BY top),
+                  percentile_cont(0.9) WITHIN GROUP (ORDER BY top)
+           FROM (
+               SELECT climbs.gym_name, date_trunc('month', climbs.climb_date)::date AS month,
+                      climbs.grade_code / 100 AS scale_prefix, sessions.username, MAX(climbs.grade_code % 100) AS top
+               FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+               WHERE climbs.sent AND climbs.grade_code IS NOT NULL AND climbs.gym_name IS NOT NULL
+               GROUP BY 1, 2, 3, 4
+           ) tops
+           GROUP BY 1, 2, 3''',
+    ]),
+    (9, 'drop the grade registry table', [
+        # Only migration 3's grade_code backfill ever read it; grades.py is the registry the app
+        # uses, so a copy in the database could only drift from it
+        'DROP TABLE IF EXISTS grades',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Arbitrary key so concurrent app processes don't apply the same migration twice
+ADVISORY_LOCK_ID = 7420190
+
+_applied_version = None
+_lock = threading.Lock()
+
+def current_version(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                 (version INTEGER PRIMARY KEY,
+                 name TEXT,
+                 applied_at TIMESTAMP DEFAULT now())''')
+    c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return c.fetchone()[0]
+
+# Bring the schema up to date. After the first successful call in a process this is a no-op.
+def run_migrations(conn, c):
+    global _applied_version
+    if _applied_version == LATEST_VERSION:
+        return []
+    with _lock:
+        if _applied_version == LATEST_VERSION:
+            return []
+        applied = []
+        c.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+        try:
+            version = current_version(c)
+            conn.commit()
+            for number, name, statements in MIGRATIONS:
+                if number <= version:
+                    continue
+                try:
+                    for statement in statements:
+                        if callable(statement):
+                            statement(c)
+                        else:
+                            c.execute(statement)
+                    c.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (number, name))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(number)
+                print(f"Applied migration {number}: {name}")
+        finally:
+            c.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
+            conn.commit()
+        _applied_version = LATEST_VERSION
+        return applied
+
+# Print the plans of the hottest page queries so index usage can be checked
+def explain_hot_queries(c, username, session_id, force_index=False):
+    from repository import PG_SESSION_DATA_SQL, PG_SEND_HISTOGRAM_SQL, PG_SUMMARY_SQL, PG_SEARCH_SQL, search_params
+
+    if force_index:
+        # Tiny dev tables are cheaper to seq-scan; this shows whether the indexes are usable at all
+        c.execute("SET LOCAL enable_seqscan = off")
+    plans = {}
+    for label, sql, params in [
+        ('session_data', PG_SESSION_DATA_SQL, (username,)),
+        ('send_histogram', PG_SEND_HISTOGRAM_SQL, (username,)),
+        ('session_summary', PG_SUMMARY_SQL, {'session_id': session_id}),
+        ('search_climbs', PG_SEARCH_SQL, search_params(username, query='overhang')),
+    ]:
+        c.execute("EXPLAIN " + sql, params)
+        plans[label] = '\n'.join(row[0] for row in c.fetchall())
+    return plans
+
+if __name__ == '__main__':
+    from db_singleton import db_cursor
+
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument('--explain', metavar='USERNAME', help="Show query plans for this user's analytics and latest session")
+    parser.add_argument('--force-index', action='store_true', help="Disable seq scans while explaining")
+    args = parser.parse_args()
+    with db_cursor() as (conn, c):
+        applied = run_migrations(conn, c)
+        print(f"Schema at version {LATEST_VERSION} ({len(applied)} migrations applied).")
+        if args.explain:
+            c.execute("SELECT MAX(session_id) FROM sessions WHERE username = %s", (args.explain,))
+            session_id = c.fetchone()[0]
+            for label, plan in explain_hot_queries(c, args.explain, session_id, args.force_index).items():
+                print(f"\n{label}\n{plan}")
+            conn.rollback()
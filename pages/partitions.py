@@ -0,0 +1,80 @@
+import re
+from datetime import date
+
+# climbs is range-partitioned by month on climb_date: climbs_pYYYYMM per month plus
+# climbs_default for anything outside them. Queries with a climb_date window only touch the
+# months in it; lookups by session or user (summaries, history, the recommender) have none and
+# probe each partition's index, which stays cheap for a few years of monthly partitions.
+# ensure_partitions keeps a few future months ready; detach_partitions turns months older than
+# the retention window into standalone archive tables.
+DEFAULT_PARTITION = 'climbs_default'
+MONTHS_AHEAD = 3
+_PARTITION_NAME = re.compile(r'^climbs_p(\d{4})(\d{2})$')
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"climbs_p{month:%Y%m}"
+
+# Columns that can be inserted (everything but generated ones such as search_vector)
+def insertable_columns(c, table='climbs'):
+    c.execute("""SELECT column_name FROM information_schema.columns
+                 WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER'
+                 ORDER BY ordinal_position""", (table,))
+    return [row[0] for row in c.fetchall()]
+
+# Attached monthly partitions as {month: name}
+def attached_partitions(c):
+    c.execute("""SELECT child.relname FROM pg_inherits
+                 JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                 JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                 WHERE parent.oid = to_regclass('climbs')""")
+    months = {}
+    for (name,) in c.fetchall():
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+def create_partition(c, month):
+    name, end = partition_name(month), add_months(month, 1)
+    # Rows that landed in the default partition for this month have to move before it can exist
+    c.execute(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE climb_date >= %s AND climb_date < %s LIMIT 1", (month, end))
+    if c.fetchone():
+        columns = ', '.join(insertable_columns(c))
+        c.execute(f"""CREATE TEMP TABLE climbs_moving AS SELECT {columns} FROM {DEFAULT_PARTITION}
+                      WHERE climb_date >= %s AND climb_date < %s""", (month, end))
+        c.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE climb_date >= %s AND climb_date < %s", (month, end))
+        c.execute(f"CREATE TABLE {name} PARTITION OF climbs FOR VALUES FROM (%s) TO (%s)", (month, end))
+        c.execute(f"INSERT INTO climbs ({columns}) SELECT {columns} FROM climbs_moving")
+        c.execute("DROP TABLE climbs_moving")
+    else:
+        c.execute(f"CREATE TABLE {name} PARTITION OF climbs FOR VALUES FROM (%s) TO (%s)", (month, end))
+    return name
+
+# Create any missing monthly partitions from first_month through months_ahead past this month
+def ensure_partitions(c, months_ahead=MONTHS_AHEAD, first_month=None, today=None):
+    existing = attached_partitions(c)
+    month = month_start(first_month or today or date.today())
+    last = add_months(month_start(today or date.today()), months_ahead)
+    created = []
+    while month <= last:
+        if month not in existing:
+            created.append(create_partition(c, month))
+        month = add_months(month, 1)
+    return created
+
+# Detach (not drop) partitions older than retain_months; they stay queryable as plain tables
+def detach_partitions(c, retain_months, today=None):
+    cutoff = add_months(month_start(today or date.today()), -retain_months)
+    detached = []
+    for month, name in sorted(attached_partitions(c).items()):
+        if month < cutoff:
+            c.execute(f"ALTER TABLE climbs DETACH PARTITION {name}")
+            detached.append(name)
+    return detached
@@ -0,0 +1,118 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from blob_store import get_blob_store
+import write_queue
+
+# Uploaded photos are stored raw, then re-encoded off the request path by a small thread pool:
+# EXIF is dropped (after applying its orientation), the image is downscaled to a display size
+# and a thumbnail, and the result reaches the climb row through the write queue.
+DEFAULT_WORKERS = 2
+DISPLAY_SIZE = 1600
+THUMB_SIZE = 256
+
+_executor = None
+_lock = threading.Lock()
+_in_flight = set()
+_resumed = False
+_status = {'submitted': 0, 'processed': 0, 'failed': 0, 'last_error': None}
+
+def _config():
+    return st.secrets.get("photo_worker", {})
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=int(_config().get("workers", DEFAULT_WORKERS)),
+                                               thread_name_prefix='climb-photo')
+    return _executor
+
+def _encode(img, max_size):
+    img = img.copy()
+    img.thumbnail((max_size, max_size))
+    out = io.BytesIO()
+    # A fresh save carries no EXIF/XMP unless it is passed in explicitly
+    try:
+        img.save(out, format='WEBP', quality=80, method=4)
+    except (KeyError, OSError):
+        # Pillow built without WebP support
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=85, optimize=True)
+    return out.getvalue(), img.size
+
+def process(data):
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        display, (width, height) = _encode(img, DISPLAY_SIZE)
+        thumb, _ = _encode(img, THUMB_SIZE)
+    store = get_blob_store()
+    return {
+        'photo_key': store.put(display),
+        'photo_thumb_key': store.put(thumb),
+        'photo_width': width,
+        'photo_height': height,
+        'photo_size': len(display),
+        'photo_status': 'ready',
+    }
+
+def _run(username, client_id, raw_key):
+    store = get_blob_store()
+    try:
+        result = process(store.get(raw_key))
+        _status['processed'] += 1
+    except Exception as e:
+        result = {'photo_status': 'failed'}
+        _status['failed'] += 1
+        _status['last_error'] = str(e)
+    finally:
+        with _lock:
+            _in_flight.discard(client_id)
+    write_queue.enqueue_photo(username, client_id, result)
+    # The original still carries EXIF (GPS etc.); only the re-encoded versions are kept. It is
+    # removed once the result is durably queued, and its key is private to this upload, so
+    # this never touches another climb's photo.
+    if result['photo_status'] == 'ready' and not _config().get("keep_originals", False):
+        store.delete(raw_key)
+
+# Store the upload as-is and return the climb's photo fields; processing continues in the background
+def store_upload(data):
+    return {
+        'photo_key': get_blob_store().put_private(data),
+        'photo_width': None,
+        'photo_height': None,
+        'photo_size': len(data),
+        'photo_status': 'pending',
+    }
+
+# Call after the climb itself has been queued, so the photo update lands after the insert
+def submit(username, client_id, raw_key):
+    with _lock:
+        if client_id in _in_flight:
+            return
+        _in_flight.add(client_id)
+    _status['submitted'] += 1
+    _get_executor().submit(_run, username, client_id, raw_key)
+
+# Re-submit photos left pending by a process that stopped before finishing them
+def resume_pending(repo):
+    global _resumed
+    if _resumed:
+        return 0
+    _resumed = True
+    resumed = 0
+    for username, client_id, raw_key in repo.pending_photos():
+        if client_id not in _in_flight:
+            submit(username, client_id, raw_key)
+            resumed += 1
+    return resumed
+
+def status():
+    with _lock:
+        return dict(_status, in_flight=len(_in_flight))
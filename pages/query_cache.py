@@ -0,0 +1,103 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+
+# In-process cache for read queries. Keys include a per-user data version that the write
+# paths bump, so a user's cached results are dropped exactly when their data changes.
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_MEGABYTES = 32
+
+_lock = threading.RLock()
+_entries = OrderedDict()
+_versions = {}
+_bytes = 0
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+_config = None
+
+def _settings():
+    global _config
+    if _config is None:
+        config = st.secrets.get("query_cache", {})
+        _config = {
+            'ttl': float(config.get("ttl_seconds", DEFAULT_TTL_SECONDS)),
+            'max_bytes': int(float(config.get("max_megabytes", DEFAULT_MAX_MEGABYTES)) * 1024 * 1024),
+        }
+    return _config
+
+def _estimate_size(value):
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    # NumPy arrays, and objects built from them that report their own footprint
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+def data_version(username):
+    return _versions.get(username, 0)
+
+# Mark a user's data as changed and free whatever was cached for them
+def bump_version(username):
+    global _bytes
+    with _lock:
+        _versions[username] = _versions.get(username, 0) + 1
+        for key in [key for key in _entries if key[1] == username]:
+            _bytes -= _entries.pop(key)[1]
+        _stats['invalidations'] += 1
+
+def bump_versions(usernames):
+    for username in usernames:
+        bump_version(username)
+
+def _evict_until(limit):
+    global _bytes
+    while _entries and _bytes > limit:
+        _, (_, size, _) = _entries.popitem(last=False)
+        _bytes -= size
+        _stats['evictions'] += 1
+
+# Return the cached result of loader() for this user and arguments, loading it on a miss
+def cached(namespace, username, loader, *args, ttl=None):
+    global _bytes
+    settings = _settings()
+    key = (namespace, username, data_version(username), args)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _entries.move_to_end(key)
+                _stats['hits'] += 1
+                return entry[2]
+            _bytes -= _entries.pop(key)[1]
+            _stats['expired'] += 1
+        _stats['misses'] += 1
+
+    value = loader()
+    size = _estimate_size(value)
+    with _lock:
+        # Skip results that alone would blow the memory cap, or whose user changed while loading
+        if size <= settings['max_bytes'] and key[2] == data_version(username):
+            if key in _entries:
+                _bytes -= _entries.pop(key)[1]
+            _entries[key] = (now + (ttl if ttl is not None else settings['ttl']), size, value)
+            _bytes += size
+            _evict_until(settings['max_bytes'])
+    return value
+
+def stats():
+    with _lock:
+        lookups = _stats['hits'] + _stats['misses']
+        return dict(_stats, entries=len(_entries), bytes=_bytes,
+                    hit_rate=_stats['hits'] / lookups if lookups else 0.0)
+
+def clear():
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
@@ -0,0 +1,210 @@
+import sys
+from datetime import date
+import numpy as np
+import query_cache
+from grades import CODE_LABELS, GYM_NAMES, JUDGMENTS, SCALES, SCALE_BY_PREFIX
+from repository import FEATURE_COLUMNS
+
+# Recommendations from a per-user feature matrix with one row per logged climb. The matrix
+# and the results built from it are query_cache entries keyed by the user's data version, so
+# they count towards the cache's memory cap, are evicted like any other entry and are rebuilt
+# only after the user logs something.
+SCALE_NAMES = list(SCALES)
+# Feature layout: scale one-hot, grade position in its scale, boulder flag, log attempts, sent,
+# stars, judgment (-1 soft .. 1 hard), gym one-hot
+FEATURE_NAMES = ([f'scale_{name}' for name in SCALE_NAMES] + ['grade', 'boulder', 'log_attempts', 'sent', 'stars',
+                 'judgment'] + [f'gym_{name}' for name in GYM_NAMES])
+# Grade position dominates similarity; gym and scale keep neighbours on comparable walls
+FEATURE_WEIGHTS = np.array([1.0] * len(SCALE_NAMES) + [3.0, 0.5, 1.0, 0.5, 0.5, 0.5] + [1.0] * len(GYM_NAMES),
+                           dtype=np.float32)
+RECENT_DAYS = 56
+NEIGHBOURS = 5
+LEVEL_QUANTILE = 0.8
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Highest ordinal per scale prefix (index = prefix), for normalising grade positions
+_SCALE_SIZES = np.zeros(max(SCALE_BY_PREFIX) + 1, dtype=np.float32)
+for _prefix, _scale in SCALE_BY_PREFIX.items():
+    _SCALE_SIZES[_prefix] = len(SCALES[_scale][2])
+_GYM_INDEX = {name: i for i, name in enumerate(GYM_NAMES)}
+_COLUMN = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+class FeatureStore:
+    def __init__(self):
+        self.features = np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+        self.codes = np.empty(0, dtype=np.int16)
+        self.gyms = np.empty(0, dtype=np.int8)
+        self.days = np.empty(0, dtype=np.int32)
+        self.sessions = np.empty(0, dtype=np.int64)
+        self.attempts = np.empty(0, dtype=np.int16)
+        self.sent = np.empty(0, dtype=bool)
+        self.name_ids = np.empty(0, dtype=np.int32)
+        self.names = []
+        self._name_index = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    # What query_cache charges for this store against its memory cap
+    @property
+    def nbytes(self):
+        arrays = [self.features, self.codes, self.gyms, self.days, self.sessions, self.attempts, self.sent,
+                  self.name_ids]
+        return sum(a.nbytes for a in arrays) + sum(sys.getsizeof(name) for name in self.names)
+
+    # Append climbs (FEATURE_COLUMNS tuples, ordered by id)
+    def append(self, rows):
+        if not rows:
+            return 0
+        col = {name: [row[i] for row in rows] for i, name in enumerate(FEATURE_COLUMNS)}
+        n = len(rows)
+        codes = np.array([code or 0 for code in col['grade_code']], dtype=np.int64)
+        prefixes = np.clip(codes // 100, 0, len(_SCALE_SIZES) - 1)
+        gyms = np.array([_GYM_INDEX.get(gym, -1) for gym in col['gym_name']], dtype=np.int64)
+        attempts = np.array([a or 1 for a in col['num_attempts']], dtype=np.int64)
+        sent = np.array(col['sent'], dtype=bool)
+        judgment = np.array([JUDGMENTS.index(j) - 1 if j in JUDGMENTS else 0 for j in col['grade_judgment']],
+                            dtype=np.float32)
+
+        features = np.zeros((n, len(FEATURE_NAMES)), dtype=np.float32)
+        graded = prefixes > 0
+        features[graded, prefixes[graded] - 1] = 1.0
+        sizes = np.maximum(_SCALE_SIZES[prefixes] - 1, 1)
+        features[:, _COLUMN['grade']] = np.where(graded, (codes % 100 - 1) / sizes, 0)
+        features[:, _COLUMN['boulder']] = np.array([t == 'Boulder' for t in col['type']], dtype=np.float32)
+        features[:, _COLUMN['log_attempts']] = np.log1p(attempts)
+        features[:, _COLUMN['sent']] = sent
+        features[:, _COLUMN['stars']] = np.array([s or 0 for s in col['star_rating']], dtype=np.float32) / 5
+        features[:, _COLUMN['judgment']] = judgment
+        known_gym = gyms >= 0
+        features[known_gym, _COLUMN[f'gym_{GYM_NAMES[0]}'] + gyms[known_gym]] = 1.0
+
+        name_ids = np.array([self._name_id(name) for name in col['climb_name']], dtype=np.int32)
+        self.features = np.concatenate([self.features, features * FEATURE_WEIGHTS])
+        self.codes = np.concatenate([self.codes, codes.astype(np.int16)])
+        self.gyms = np.concatenate([self.gyms, gyms.astype(np.int8)])
+        self.days = np.concatenate([self.days, np.fromiter(map(date.toordinal, col['climb_date']), dtype=np.int32,
+                                                          count=n) - EPOCH_ORDINAL])
+        self.sessions = np.concatenate([self.sessions, np.array(col['session_id'], dtype=np.int64)])
+        self.attempts = np.concatenate([self.attempts, attempts.astype(np.int16)])
+        self.sent = np.concatenate([self.sent, sent])
+        self.name_ids = np.concatenate([self.name_ids, name_ids])
+        return n
+
+    # Unnamed climbs share id -1 and are never suggested as projects
+    def _name_id(self, name):
+        name = (name or '').strip()
+        if not name:
+            return -1
+        if name not in self._name_index:
+            self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return self._name_index[name]
+
+    # Climbs from the last RECENT_DAYS before the latest logged climb, or everything if that is empty
+    def recent(self):
+        mask = self.days >= self.days.max() - RECENT_DAYS
+        return mask if mask.any() else np.ones(len(self), dtype=bool)
+
+def _build_store(repo, username):
+    store = FeatureStore()
+    store.append(repo.feature_climbs(username))
+    return store
+
+# Rebuilt from all of the user's climbs for each data version. Reading only ids above the last
+# one seen would miss climbs that commit out of id order (concurrent flushes, climb_io imports).
+def feature_store(repo, username):
+    return query_cache.cached('feature_store', username, lambda: _build_store(repo, username))
+
+# Grade ordinal the user sends reliably, per scale prefix (0 where they have no sends)
+def send_levels(store, mask):
+    levels = np.zeros(len(_SCALE_SIZES), dtype=np.int64)
+    prefixes = store.codes // 100
+    for prefix in SCALE_BY_PREFIX:
+        ordinals = store.codes[mask & store.sent & (prefixes == prefix)] % 100
+        if len(ordinals):
+            levels[prefix] = int(np.ceil(np.quantile(ordinals, LEVEL_QUANTILE)))
+    return levels
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-6)
+
+# Named climbs tried but never sent, at or just above the user's send level, ranked by how
+# closely they resemble the climbs the user has sent recently (mean of the top-k cosine scores)
+def next_projects(store, limit=10):
+    if not len(store):
+        return []
+    recent = store.recent()
+    levels = send_levels(store, recent)
+    ordinals = store.codes.astype(np.int64) % 100
+    prefixes = store.codes.astype(np.int64) // 100
+
+    # One key per named climb on one gym's wall at one grade
+    keys = (store.name_ids.astype(np.int64) * 1000 + store.codes) * 64 + store.gyms
+    sent_keys = np.unique(keys[store.sent])
+    level = levels[prefixes]
+    candidates = ((store.name_ids >= 0) & ~store.sent & ~np.isin(keys, sent_keys) & (prefixes > 0)
+                  & (ordinals >= level) & (ordinals <= level + 2))
+    references = store.features[recent & store.sent]
+    if not candidates.any() or not len(references):
+        return []
+
+    # Latest attempt row stands for each candidate climb; attempts add up across sessions
+    candidate_rows = np.flatnonzero(candidates)
+    unique_keys, inverse = np.unique(keys[candidate_rows], return_inverse=True)
+    latest = np.zeros(len(unique_keys), dtype=np.int64)
+    np.maximum.at(latest, inverse, candidate_rows)
+    total_attempts = np.bincount(inverse, weights=store.attempts[candidate_rows], minlength=len(unique_keys))
+
+    similarity = _unit_rows(store.features[latest]) @ _unit_rows(references).T
+    k = min(NEIGHBOURS, similarity.shape[1])
+    score = np.partition(similarity, -k, axis=1)[:, -k:].mean(axis=1)
+    order = np.argsort(-score)[:limit]
+    return [{
+        'climb_name': store.names[store.name_ids[row]],
+        'gym_name': GYM_NAMES[store.gyms[row]] if store.gyms[row] >= 0 else None,
+        'grade': CODE_LABELS.get(int(store.codes[row])),
+        'attempts': int(total_attempts[i]),
+        'last_tried': date.fromordinal(int(store.days[row]) + EPOCH_ORDINAL),
+        'similarity': round(float(score[i]), 3),
+    } for i, row in ((i, latest[i]) for i in order)]
+
+# Suggested climbs for the next session at each gym: mostly volume below the send level, some
+# at it and a couple of tries one grade up, sized to the user's recent climbs per session
+def session_targets(store):
+    if not len(store):
+        return {}
+    recent = store.recent()
+    levels = send_levels(store, recent)
+    prefixes = store.codes.astype(np.int64) // 100
+    targets = {}
+    for gym in np.unique(store.gyms[recent & (store.gyms >= 0)]):
+        at_gym = recent & (store.gyms == gym)
+        _, per_session = np.unique(store.sessions[at_gym], return_counts=True)
+        per_session_climbs = per_session.mean()
+        plan = []
+        scale_prefixes, scale_counts = np.unique(prefixes[at_gym & (prefixes > 0)], return_counts=True)
+        for prefix, share in zip(scale_prefixes, scale_counts / at_gym.sum()):
+            level = levels[prefix]
+            if not level:
+                continue
+            # Split the usual session size between the scales climbed here
+            climbs = max(3, int(round(per_session_climbs * share)))
+            top = int(_SCALE_SIZES[prefix])
+            volume = climbs - 2 - round(0.25 * climbs)
+            for ordinal, count, purpose in [(level + 1, 2, 'project'), (level, round(0.25 * climbs), 'limit'),
+                                            (level - 1, volume, 'volume')]:
+                ordinal = min(max(ordinal, 1), top)
+                if count > 0:
+                    plan.append({'grade': CODE_LABELS[prefix * 100 + ordinal], 'climbs': int(count), 'purpose': purpose})
+        if plan:
+            targets[GYM_NAMES[gym]] = plan
+    return targets
+
+def _recommend(repo, username):
+    store = feature_store(repo, username)
+    return {'projects': next_projects(store), 'targets': session_targets(store)}
+
+def recommendations(repo, username):
+    return query_cache.cached('recommendations', username, lambda: _recommend(repo, username))
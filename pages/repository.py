@@ -0,0 +1,744 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+import streamlit as st
+from instrumentation import InstrumentedConnection
+
+# All of the app's page queries live behind a repository. PostgresRepository talks to RDS
+# through the connection pool; SQLiteRepository is an embedded, zero-network stand-in for
+# offline use, tests and benchmarks. Pick one with [storage] backend = "postgres" | "sqlite".
+SUMMARY_COLUMNS = ['session_id', 'total_climbs', 'top_grade', 'top_grade_count', 'avg_attempts', 'start_time', 'end_time', 'climbs']
+SESSION_DATA_COLUMNS = ['session_id', 'session_name', 'start_time', 'end_time', 'num_climbs', 'most_frequent_grade']
+SEND_HISTOGRAM_COLUMNS = ['iso_year', 'iso_week', 'grade_code', 'sends']
+ROLLUP_COLUMNS = ['iso_year', 'iso_week', 'total_minutes', 'climb_count', 'sends', 'grade_histogram']
+CLIMB_COLUMNS = ['client_id', 'session_id', 'photo_key', 'photo_width', 'photo_height', 'photo_size', 'photo_status', 'climb_date',
+                 'climb_name', 'gym_name', 'grade', 'grade_code', 'grade_judgment', 'num_attempts', 'sent', 'notes',
+                 'star_rating', 'type']
+PHOTO_COLUMNS = ['photo_key', 'photo_thumb_key', 'photo_width', 'photo_height', 'photo_size', 'photo_status']
+SESSION_PHOTO_COLUMNS = ['climb_name', 'grade', 'photo_status', 'photo_thumb_key', 'photo_key']
+# Narrow per-climb columns for the training metrics engine; never the photo fields. Climbs
+# without a climb_date (possible in SQLite, and in Postgres before migration 8) are left out.
+TRAINING_COLUMNS = ['climb_date', 'grade_code', 'num_attempts', 'sent', 'star_rating', 'grade_judgment']
+# Per-climb inputs of the recommender's feature store, ordered by climb id (dated climbs only)
+FEATURE_COLUMNS = ['id', 'session_id', 'climb_date', 'climb_name', 'gym_name', 'grade_code', 'type', 'num_attempts',
+                   'sent', 'star_rating', 'grade_judgment']
+SEARCH_COLUMNS = ['id', 'climb_date', 'climb_name', 'gym_name', 'grade', 'sent', 'num_attempts', 'star_rating', 'notes']
+# Gym dashboard rows: busiest hours (ISO weekday 1-7), popular grades and monthly levels,
+# where levels are grade ordinals within the scale given by scale_prefix
+GYM_HOURLY_COLUMNS = ['weekday', 'hour', 'sessions', 'minutes']
+GYM_GRADE_COLUMNS = ['grade_code', 'climbs', 'sends', 'attempts']
+GYM_LEVEL_COLUMNS = ['month', 'scale_prefix', 'climbers', 'median_top', 'p90_top']
+USER_TOP_COLUMNS = ['month', 'scale_prefix', 'top']
+HISTORY_CLIMB_COLUMNS = ['climb_date', 'climb_name', 'gym_name', 'grade', 'grade_code', 'type', 'grade_judgment',
+                         'num_attempts', 'sent', 'notes', 'star_rating']
+
+# All summary stats and the climb list for one session in a single round trip
+PG_SUMMARY_SQL = """
+    WITH session_climbs AS (
+        SELECT id, climb_name, grade, grade_judgment, star_rating, num_attempts
+        FROM climbs
+        WHERE session_id = %(session_id)s
+    ),
+    top_grade AS (
+        SELECT grade, COUNT(*) AS grade_count
+        FROM session_climbs
+        GROUP BY grade
+        ORDER BY COUNT(*) DESC
+        LIMIT 1
+    )
+    SELECT
+        sessions.session_id,
+        (SELECT COUNT(*) FROM session_climbs) AS total_climbs,
+        (SELECT grade FROM top_grade) AS top_grade,
+        (SELECT grade_count FROM top_grade) AS top_grade_count,
+        (SELECT AVG(num_attempts) FROM session_climbs) AS avg_attempts,
+        sessions.start_time,
+        sessions.end_time,
+        COALESCE((SELECT json_agg(json_build_array(climb_name, grade, grade_judgment, star_rating) ORDER BY id)
+                  FROM session_climbs), '[]'::json) AS climbs
+    FROM sessions
+    WHERE sessions.session_id = %(session_id)s
+"""
+
+PG_SESSION_DATA_SQL = """
+    SELECT
+        sessions.session_id,
+        CONCAT(sessions.gym_name, ' (', start_time::date, ')') as session_name,
+        start_time,
+        end_time,
+        COUNT(climbs.id) as num_climbs,
+        MODE() WITHIN GROUP (ORDER BY climbs.grade) as most_frequent_grade
+    FROM sessions
+    LEFT JOIN climbs ON sessions.session_id = climbs.session_id
+    WHERE username = %s AND state <> 'draft'
+    GROUP BY sessions.session_id, start_time, end_time
+    ORDER BY start_time DESC
+"""
+
+# Sent climbs per week and grade code; the grade statistics are derived from this small histogram
+PG_SEND_HISTOGRAM_SQL = """
+    SELECT
+        EXTRACT(ISOYEAR FROM climbs.climb_date)::int AS iso_year,
+        EXTRACT(WEEK FROM climbs.climb_date)::int AS iso_week,
+        climbs.grade_code,
+        COUNT(*) AS sends
+    FROM sessions
+    JOIN climbs ON sessions.session_id = climbs.session_id
+    WHERE sessions.username = %s AND climbs.sent AND climbs.grade_code IS NOT NULL
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+"""
+
+# One page of a user's climbs, newest first. Text matches the tsvector (whole words), the
+# climb name trigrams (typos) or a climb name substring; paging continues after (climb_date, id).
+PG_SEARCH_SQL = f"""
+    SELECT {', '.join('climbs.' + col for col in SEARCH_COLUMNS)}
+    FROM climbs
+    JOIN sessions ON sessions.session_id = climbs.session_id
+    WHERE sessions.username = %(username)s
+      AND (%(query)s IS NULL
+           OR climbs.search_vector @@ websearch_to_tsquery('english', %(query)s)
+           OR climbs.climb_name %% %(query)s
+           OR climbs.climb_name ILIKE %(pattern)s)
+      AND (%(gym_name)s IS NULL OR climbs.gym_name = %(gym_name)s)
+      AND (%(grade)s IS NULL OR climbs.grade = %(grade)s)
+      AND (%(sent)s IS NULL OR climbs.sent = %(sent)s)
+      AND (%(after_date)s IS NULL OR (climbs.climb_date, climbs.id) < (%(after_date)s, %(after_id)s))
+    ORDER BY climbs.climb_date DESC, climbs.id DESC
+    LIMIT %(limit)s
+"""
+
+def _like_pattern(text):
+    return '%' + text.replace('\\', '\\\\').replace('%', r'\%').replace('_', r'\_') + '%'
+
+# after is the (climb_date, id) of the last row of the previous page, or None for the first page
+def search_params(username, query=None, gym_name=None, grade=None, sent=None, after=None, limit=25):
+    query = query.strip() if query and query.strip() else None
+    return {
+        'username': username, 'query': query, 'pattern': _like_pattern(query) if query else None,
+        'gym_name': gym_name, 'grade': grade, 'sent': sent,
+        'after_date': after[0] if after else None, 'after_id': after[1] if after else None, 'limit': limit,
+    }
+
+class PostgresRepository:
+    name = 'postgres'
+
+    def __init__(self):
+        import db_singleton
+        import migrations
+        import rollups
+        from psycopg2.extras import execute_values
+
+        self._db = db_singleton
+        self._migrations = migrations
+        self._rollups = rollups
+        self._execute_values = execute_values
+        self._migrated = False
+
+    def cursor(self):
+        return self._db.db_cursor()
+
+    # Called on every rerun; after the first success it returns without checking out a connection
+    def migrate(self):
+        if self._migrated:
+            return []
+        with self.cursor() as (conn, c):
+            applied = self._migrations.run_migrations(conn, c)
+        self._migrated = True
+        return applied
+
+    def create_session(self, username, start_time, gym_name):
+        with self.cursor() as (conn, c):
+            c.execute("""INSERT INTO sessions (username, start_time, gym_name, state)
+                         VALUES (%s, %s, %s, 'draft') RETURNING session_id""",
+                      (username, start_time, gym_name))
+            session_id = c.fetchone()[0]
+            conn.commit()
+        return session_id
+
+    # Apply queued ('climb' | 'photo' | 'session_end', payload) operations in order, in one transaction
+    def apply_writes(self, operations):
+        with self.cursor() as (conn, c):
+            climbs = []
+            for kind, payload in operations:
+                if kind == 'climb':
+                    climbs.append(payload)
+                    continue
+                # Consecutive climbs go out as one multi-row insert before the next other operation
+                if climbs:
+                    self._insert_climbs(c, climbs)
+                    climbs = []
+                if kind == 'photo':
+                    self._update_photo(c, payload)
+                else:
+                    self._end_session(c, payload)
+            if climbs:
+                self._insert_climbs(c, climbs)
+            conn.commit()
+
+    def _insert_climbs(self, c, payloads):
+        rows = [tuple(p.get(col) for col in CLIMB_COLUMNS) for p in payloads]
+        inserted = self._execute_values(c, f"""
+            INSERT INTO climbs ({', '.join(CLIMB_COLUMNS)}) VALUES %s
+            ON CONFLICT (client_id, climb_date) DO NOTHING
+            RETURNING client_id::text
+        """, rows, fetch=True)
+        inserted = {row[0] for row in inserted}
+        # A draft becomes active with its first logged climb
+        session_ids = sorted({p['session_id'] for p in payloads if p['client_id'] in inserted})
+        if session_ids:
+            c.execute("""UPDATE sessions SET state = 'active'
+                         WHERE session_id = ANY(%s) AND state = 'draft'""", (session_ids,))
+        # Only climbs that were actually new count towards the rollups
+        self._rollups.record_climbs(c, [(p['username'], date.fromisoformat(p['climb_date']), p['grade'], p['sent'])
+                                        for p in payloads if p['client_id'] in inserted])
+
+    # Only a pending photo is updated, so a late retry can't overwrite a finished one
+    def _update_photo(self, c, p):
+        columns = [col for col in PHOTO_COLUMNS if col in p]
+        c.execute(f"""UPDATE climbs SET {', '.join(f'{col} = %s' for col in columns)}
+                      WHERE client_id = %s AND photo_status = 'pending'""",
+                  [p[col] for col in columns] + [p['client_id']])
+
+    def _end_session(self, c, p):
+        c.execute("""UPDATE sessions SET end_time = %s, duration = %s, state = 'ended'
+                     WHERE session_id = %s AND end_time IS NULL""",
+                  (p['end_time'], p['duration'], p['session_id']))
+        if c.rowcount:
+            self._rollups.record_session_end(c, p['username'], datetime.fromisoformat(p['start_time']), p['duration'])
+        # Freeze the summary of a finished session; later reads only touch session_summaries
+        c.execute(f"""INSERT INTO session_summaries ({', '.join(SUMMARY_COLUMNS)})
+                      {PG_SUMMARY_SQL}
+                      ON CONFLICT (session_id) DO NOTHING""", {'session_id': p['session_id']})
+
+    def session_exists(self, session_id):
+        with self.cursor() as (conn, c):
+            c.execute("SELECT 1 FROM sessions WHERE session_id = %s", (session_id,))
+            return c.fetchone() is not None
+
+    def session_summary(self, session_id):
+        with self.cursor() as (conn, c):
+            c.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM session_summaries WHERE session_id = %s", (session_id,))
+            row = c.fetchone()
+            if row is None:
+                # Session still open (or ended before summaries existed), compute it live
+                c.execute(PG_SUMMARY_SQL, {'session_id': session_id})
+                row = c.fetchone()
+        return dict(zip(SUMMARY_COLUMNS, row)) if row else None
+
+    def session_data(self, username):
+        with self.cursor() as (conn, c):
+            c.execute(PG_SESSION_DATA_SQL, (username,))
+            return c.fetchall()
+
+    def send_histogram(self, username):
+        with self.cursor() as (conn, c):
+            c.execute(PG_SEND_HISTOGRAM_SQL, (username,))
+            return c.fetchall()
+
+    def weekly_rollups(self, username):
+        with self.cursor() as (conn, c):
+            return self._rollups.get_weekly_rollups(username, c)
+
+    def training_climbs(self, username):
+        with self.cursor() as (conn, c):
+            c.execute(f"""SELECT {', '.join('climbs.' + col for col in TRAINING_COLUMNS)}
+                          FROM sessions JOIN climbs ON sessions.session_id = climbs.session_id
+                          WHERE sessions.username = %s AND climbs.climb_date IS NOT NULL""", (username,))
+            return c.fetchall()
+
+    def feature_climbs(self, username):
+        with self.cursor() as (conn, c):
+            c.execute(f"""SELECT {', '.join('climbs.' + col for col in FEATURE_COLUMNS)}
+                          FROM sessions JOIN climbs ON sessions.session_id = climbs.session_id
+                          WHERE sessions.username = %s AND climbs.climb_date IS NOT NULL
+                          ORDER BY climbs.id""", (username,))
+            return c.fetchall()
+
+    def search_climbs(self, username, query=None, gym_name=None, grade=None, sent=None, after=None, limit=25):
+        with self.cursor() as (conn, c):
+            c.execute(PG_SEARCH_SQL, search_params(username, query, gym_name, grade, sent, after, limit))
+            return c.fetchall()
+
+    def session_photos(self, session_id):
+        with self.cursor() as (conn, c):
+            c.execute(f"""SELECT {', '.join(SESSION_PHOTO_COLUMNS)} FROM climbs
+                          WHERE session_id = %s AND photo_key IS NOT NULL ORDER BY id""", (session_id,))
+            return c.fetchall()
+
+    # (username, client_id, raw photo key) of uploads the photo worker has not finished
+    def pending_photos(self):
+        with self.cursor() as (conn, c):
+            c.execute("""SELECT sessions.username, climbs.client_id::text, climbs.photo_key
+                         FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+                         WHERE climbs.photo_status = 'pending'""")
+            return c.fetchall()
+
+    # The gym_* tables are refreshed by gym_stats, so these read precomputed rows only
+    def gym_hourly(self, gym_name, since):
+        with self.cursor() as (conn, c):
+            c.execute("""SELECT EXTRACT(ISODOW FROM day)::int, hour, SUM(sessions), SUM(minutes)
+                         FROM gym_hourly_stats WHERE gym_name = %s AND day >= %s
+                         GROUP BY 1, 2 ORDER BY 1, 2""", (gym_name, since))
+            return c.fetchall()
+
+    def gym_grades(self, gym_name, since):
+        with self.cursor() as (conn, c):
+            c.execute("""SELECT grade_code, SUM(climbs), SUM(sends), SUM(attempts)
+                         FROM gym_grade_stats WHERE gym_name = %s AND month >= date_trunc('month', %s::date)
+                         GROUP BY 1 ORDER BY 1""", (gym_name, since))
+            return c.fetchall()
+
+    def gym_levels(self, gym_name, since):
+        with self.cursor() as (conn, c):
+            c.execute(f"""SELECT {', '.join(GYM_LEVEL_COLUMNS)} FROM gym_monthly_levels
+                          WHERE gym_name = %s AND month >= date_trunc('month', %s::date)
+                          ORDER BY month, scale_prefix""", (gym_name, since))
+            return c.fetchall()
+
+    # The climb_date bound keeps this to the partitions in the window
+    def user_monthly_tops(self, username, gym_name, since):
+        with self.cursor() as (conn, c):
+            c.execute("""SELECT date_trunc('month', climbs.climb_date)::date, climbs.grade_code / 100,
+                                MAX(climbs.grade_code %% 100)
+                         FROM sessions JOIN climbs ON sessions.session_id = climbs.session_id
+                         WHERE sessions.username = %s AND climbs.gym_name = %s AND climbs.sent
+                           AND climbs.grade_code IS NOT NULL AND climbs.climb_date >= date_trunc('month', %s::date)
+                         GROUP BY 1, 2 ORDER BY 1, 2""", (username, gym_name, since))
+            return c.fetchall()
+
+    # Close active sessions started before cutoff. Their real end is unknown, so end_time and
+    # duration stay NULL (no minutes in the rollups) and the user can still end them later.
+    def close_stale_sessions(self, cutoff):
+        with self.cursor() as (conn, c):
+            c.execute("UPDATE sessions SET state = 'ended' WHERE state = 'active' AND start_time < %s", (cutoff,))
+            closed = c.rowcount
+            conn.commit()
+        return closed
+
+    # Delete ended sessions started before cutoff, and drafts started before draft_cutoff, that
+    # never got a climb; returns rows removed per table. Drafts get longer because a browser may
+    # still be logging against one.
+    def purge_empty_sessions(self, cutoff, draft_cutoff):
+        with self.cursor() as (conn, c):
+            c.execute("""CREATE TEMP TABLE empty_sessions ON COMMIT DROP AS
+                         SELECT session_id, username, duration FROM sessions
+                         WHERE ((state = 'ended' AND start_time < %s) OR (state = 'draft' AND start_time < %s))
+                           AND NOT EXISTS (SELECT 1 FROM climbs WHERE climbs.session_id = sessions.session_id)""",
+                      (cutoff, draft_cutoff))
+            c.execute("DELETE FROM session_summaries WHERE session_id IN (SELECT session_id FROM empty_sessions)")
+            summaries = c.rowcount
+            c.execute("DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM empty_sessions)")
+            sessions = c.rowcount
+            # Ended empty sessions still counted their minutes in the weekly rollups
+            c.execute("SELECT DISTINCT username FROM empty_sessions WHERE duration IS NOT NULL")
+            users = [row[0] for row in c.fetchall()]
+            conn.commit()
+            for username in users:
+                self._rollups.rebuild(conn, c, username)
+        return {'sessions': sessions, 'session_summaries': summaries}
+
+    # Bulk-load generated or imported history: [{session fields..., 'climbs': [...]}]
+    def load_history(self, sessions, batch_size=500):
+        session_count = climb_count = 0
+        with self.cursor() as (conn, c):
+            users = set()
+            for start in range(0, len(sessions), batch_size):
+                batch = sessions[start:start + batch_size]
+                ids = self._execute_values(c, """
+                    INSERT INTO sessions (username, start_time, end_time, gym_name, duration) VALUES %s
+                    RETURNING session_id
+                """, [(s['username'], s['start_time'], s['end_time'], s['gym_name'], s['duration']) for s in batch], fetch=True)
+                rows = [(session_id,) + tuple(climb[col] for col in HISTORY_CLIMB_COLUMNS)
+                        for (session_id,), s in zip(ids, batch) for climb in s['climbs']]
+                if rows:
+                    self._execute_values(c, f"""INSERT INTO climbs (session_id, {', '.join(HISTORY_CLIMB_COLUMNS)})
+                                                VALUES %s""", rows, page_size=1000)
+                conn.commit()
+                users.update(s['username'] for s in batch)
+                session_count += len(batch)
+                climb_count += len(rows)
+            for username in users:
+                self._rollups.rebuild(conn, c, username)
+            c.execute("ANALYZE sessions")
+            c.execute("ANALYZE climbs")
+            conn.commit()
+        return session_count, climb_count
+
+    def delete_users(self, prefix):
+        pattern = prefix.replace('_', r'\_') + r'\_%'
+        with self.cursor() as (conn, c):
+            c.execute("""DELETE FROM session_summaries
+                         WHERE session_id IN (SELECT session_id FROM sessions WHERE username LIKE %s)""", (pattern,))
+            c.execute("""DELETE FROM climbs
+                         WHERE session_id IN (SELECT session_id FROM sessions WHERE username LIKE %s)""", (pattern,))
+            c.execute("DELETE FROM sessions WHERE username LIKE %s", (pattern,))
+            c.execute("DELETE FROM weekly_rollups WHERE username LIKE %s", (pattern,))
+            conn.commit()
+
+SQLITE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sessions
+        (session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        start_time TIMESTAMP,
+        end_time TIMESTAMP,
+        gym_name TEXT,
+        duration INTEGER,
+        state TEXT NOT NULL DEFAULT 'ended');
+    CREATE TABLE IF NOT EXISTS climbs
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER REFERENCES sessions(session_id),
+        client_id TEXT UNIQUE,
+        photo_key TEXT,
+        photo_width INTEGER,
+        photo_height INTEGER,
+        photo_size INTEGER,
+        photo_status TEXT,
+        photo_thumb_key TEXT,
+        climb_date DATE,
+        climb_name TEXT,
+        gym_name TEXT,
+        grade TEXT,
+        grade_code INTEGER,
+        grade_judgment TEXT,
+        num_attempts INTEGER,
+        sent BOOLEAN,
+        notes TEXT,
+        star_rating INT,
+        type TEXT);
+    CREATE INDEX IF NOT EXISTS climbs_session_id_idx ON climbs (session_id);
+    CREATE INDEX IF NOT EXISTS sessions_username_start_time_idx ON sessions (username, start_time DESC);
+    CREATE INDEX IF NOT EXISTS climbs_climb_date_id_idx ON climbs (climb_date DESC, id DESC);
+'''
+
+# Columns added after the first SQLite release; older files get them (and a backfill) on migrate()
+SQLITE_ADDED_COLUMNS = [
+    ('climbs', 'photo_status', 'TEXT', "UPDATE climbs SET photo_status = 'ready' WHERE photo_key IS NOT NULL"),
+    ('climbs', 'photo_thumb_key', 'TEXT', None),
+    ('sessions', 'state', "TEXT NOT NULL DEFAULT 'ended'", """
+        UPDATE sessions SET state = CASE
+            WHEN EXISTS (SELECT 1 FROM climbs WHERE climbs.session_id = sessions.session_id) THEN 'active'
+            ELSE 'draft' END
+        WHERE end_time IS NULL"""),
+]
+
+SQLITE_SUMMARY_SQL = """
+    WITH session_climbs AS (
+        SELECT id, climb_name, grade, grade_judgment, star_rating, num_attempts
+        FROM climbs
+        WHERE session_id = :session_id
+    ),
+    top_grade AS (
+        SELECT grade, COUNT(*) AS grade_count
+        FROM session_climbs
+        GROUP BY grade
+        ORDER BY COUNT(*) DESC
+        LIMIT 1
+    )
+    SELECT
+        sessions.session_id,
+        (SELECT COUNT(*) FROM session_climbs),
+        (SELECT grade FROM top_grade),
+        (SELECT grade_count FROM top_grade),
+        (SELECT AVG(num_attempts) FROM session_climbs),
+        sessions.start_time,
+        sessions.end_time,
+        (SELECT json_group_array(json_array(climb_name, grade, grade_judgment, star_rating))
+         FROM (SELECT * FROM session_climbs ORDER BY id))
+    FROM sessions
+    WHERE sessions.session_id = :session_id
+"""
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('BOOLEAN', lambda value: value not in (b'0', b''))
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+# Linear interpolation between ranks, as Postgres percentile_cont does
+def _percentile(values, fraction):
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+class SQLiteRepository:
+    name = 'sqlite'
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'climb_log.sqlite3')
+        self._migrated = False
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return InstrumentedConnection(conn)
+
+    def migrate(self):
+        if not self._migrated:
+            conn = self.connect()
+            try:
+                conn.executescript(SQLITE_SCHEMA)
+                for table, column, column_type, backfill in SQLITE_ADDED_COLUMNS:
+                    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                    if column not in existing:
+                        with conn:
+                            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                            if backfill:
+                                conn.execute(backfill)
+            finally:
+                conn.close()
+            self._migrated = True
+        return []
+
+    def _query(self, sql, params=()):
+        conn = self.connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def create_session(self, username, start_time, gym_name):
+        conn = self.connect()
+        try:
+            with conn:
+                cursor = conn.execute("""INSERT INTO sessions (username, start_time, gym_name, state)
+                                         VALUES (?, ?, ?, 'draft')""", (username, start_time, gym_name))
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def apply_writes(self, operations):
+        conn = self.connect()
+        try:
+            with conn:
+                for kind, p in operations:
+                    if kind == 'climb':
+                        inserted = conn.execute(f"""INSERT OR IGNORE INTO climbs ({', '.join(CLIMB_COLUMNS)})
+                                                    VALUES ({', '.join('?' * len(CLIMB_COLUMNS))})""",
+                                                [p.get(col) for col in CLIMB_COLUMNS]).rowcount
+                        if inserted:
+                            conn.execute("""UPDATE sessions SET state = 'active'
+                                            WHERE session_id = ? AND state = 'draft'""", (p['session_id'],))
+                    elif kind == 'photo':
+                        columns = [col for col in PHOTO_COLUMNS if col in p]
+                        conn.execute(f"""UPDATE climbs SET {', '.join(f'{col} = ?' for col in columns)}
+                                         WHERE client_id = ? AND photo_status = 'pending'""",
+                                     [p[col] for col in columns] + [p['client_id']])
+                    else:
+                        conn.execute("""UPDATE sessions SET end_time = ?, duration = ?, state = 'ended'
+                                        WHERE session_id = ? AND end_time IS NULL""",
+                                     (datetime.fromisoformat(p['end_time']), p['duration'], p['session_id']))
+        finally:
+            conn.close()
+
+    def session_exists(self, session_id):
+        return bool(self._query("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)))
+
+    # Summaries are cheap to compute in-process, so there is no frozen copy here
+    def session_summary(self, session_id):
+        rows = self._query(SQLITE_SUMMARY_SQL, {'session_id': session_id})
+        if not rows:
+            return None
+        summary = dict(zip(SUMMARY_COLUMNS, rows[0]))
+        summary['climbs'] = json.loads(summary['climbs'])
+        return summary
+
+    def session_data(self, username):
+        return self._query("""
+            SELECT
+                sessions.session_id,
+                sessions.gym_name || ' (' || date(sessions.start_time) || ')',
+                sessions.start_time,
+                sessions.end_time,
+                COUNT(climbs.id),
+                (SELECT grade FROM climbs AS c2 WHERE c2.session_id = sessions.session_id
+                 GROUP BY grade ORDER BY COUNT(*) DESC, grade LIMIT 1)
+            FROM sessions
+            LEFT JOIN climbs ON sessions.session_id = climbs.session_id
+            WHERE sessions.username = ? AND sessions.state <> 'draft'
+            GROUP BY sessions.session_id
+            ORDER BY sessions.start_time DESC
+        """, (username,))
+
+    def _climbs_by_day(self, username, sent_only=False):
+        return self._query(f"""
+            SELECT climbs.climb_date, climbs.grade, climbs.grade_code, climbs.sent, COUNT(*)
+            FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+            WHERE sessions.username = ? AND climbs.climb_date IS NOT NULL {'AND climbs.sent' if sent_only else ''}
+            GROUP BY climbs.climb_date, climbs.grade, climbs.grade_code, climbs.sent
+        """, (username,))
+
+    def send_histogram(self, username):
+        counts = {}
+        for climb_date, _, grade_code, _, count in self._climbs_by_day(username, sent_only=True):
+            if grade_code is None:
+                continue
+            key = climb_date.isocalendar()[:2] + (grade_code,)
+            counts[key] = counts.get(key, 0) + count
+        return [key + (count,) for key, count in sorted(counts.items())]
+
+    # SQLite has no ISO week function, so group the per-day counts by ISO week in Python
+    def weekly_rollups(self, username):
+        weeks = {}
+        for climb_date, grade, _, sent, count in self._climbs_by_day(username):
+            week = weeks.setdefault(climb_date.isocalendar()[:2], [0.0, 0, 0, {}])
+            week[1] += count
+            week[2] += count if sent else 0
+            week[3][grade] = week[3].get(grade, 0) + count
+        for start_time, duration in self._query(
+                """SELECT start_time, duration FROM sessions
+                   WHERE username = ? AND duration IS NOT NULL AND start_time IS NOT NULL""", (username,)):
+            weeks.setdefault(start_time.isocalendar()[:2], [0.0, 0, 0, {}])[0] += duration / 60.0
+        return [key + tuple(values) for key, values in sorted(weeks.items())]
+
+    def training_climbs(self, username):
+        return self._query(f"""SELECT {', '.join('climbs.' + col for col in TRAINING_COLUMNS)}
+                               FROM sessions JOIN climbs ON sessions.session_id = climbs.session_id
+                               WHERE sessions.username = ? AND climbs.climb_date IS NOT NULL""", (username,))
+
+    def feature_climbs(self, username):
+        return self._query(f"""SELECT {', '.join('climbs.' + col for col in FEATURE_COLUMNS)}
+                               FROM sessions JOIN climbs ON sessions.session_id = climbs.session_id
+                               WHERE sessions.username = ? AND climbs.climb_date IS NOT NULL
+                               ORDER BY climbs.id""", (username,))
+
+    # No full-text index here: every word has to appear in the name, notes or gym (LIKE)
+    def search_climbs(self, username, query=None, gym_name=None, grade=None, sent=None, after=None, limit=25):
+        params = search_params(username, query, gym_name, grade, sent, after, limit)
+        terms = (params['query'] or '').split()
+        params.update({f'term{i}': _like_pattern(term) for i, term in enumerate(terms)})
+        text_filter = ''.join(
+            f""" AND (climbs.climb_name LIKE :term{i} ESCAPE '\\' OR climbs.notes LIKE :term{i} ESCAPE '\\'
+                      OR climbs.gym_name LIKE :term{i} ESCAPE '\\')""" for i in range(len(terms)))
+        return self._query(f"""
+            SELECT {', '.join('climbs.' + col for col in SEARCH_COLUMNS)}
+            FROM climbs
+            JOIN sessions ON sessions.session_id = climbs.session_id
+            WHERE sessions.username = :username {text_filter}
+              AND (:gym_name IS NULL OR climbs.gym_name = :gym_name)
+              AND (:grade IS NULL OR climbs.grade = :grade)
+              AND (:sent IS NULL OR climbs.sent = :sent)
+              AND (:after_date IS NULL OR (climbs.climb_date, climbs.id) < (:after_date, :after_id))
+            ORDER BY climbs.climb_date DESC, climbs.id DESC
+            LIMIT :limit
+        """, params)
+
+    def session_photos(self, session_id):
+        return self._query(f"""SELECT {', '.join(SESSION_PHOTO_COLUMNS)} FROM climbs
+                               WHERE session_id = ? AND photo_key IS NOT NULL ORDER BY id""", (session_id,))
+
+    def pending_photos(self):
+        return self._query("""SELECT sessions.username, climbs.client_id, climbs.photo_key
+                              FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+                              WHERE climbs.photo_status = 'pending'""")
+
+    # No aggregate tables here; the dashboard queries are computed from sessions and climbs
+    def gym_hourly(self, gym_name, since):
+        hours = {}
+        for start_time, duration in self._query("""SELECT start_time, duration FROM sessions
+                                                    WHERE gym_name = ? AND state <> 'draft' AND start_time >= ?""",
+                                                 (gym_name, since)):
+            slot = hours.setdefault((start_time.isoweekday(), start_time.hour), [0, 0.0])
+            slot[0] += 1
+            slot[1] += (duration or 0) / 60.0
+        return [key + tuple(values) for key, values in sorted(hours.items())]
+
+    def gym_grades(self, gym_name, since):
+        return self._query("""SELECT grade_code, COUNT(*), SUM(sent), COALESCE(SUM(num_attempts), 0)
+                              FROM climbs WHERE gym_name = ? AND grade_code IS NOT NULL AND climb_date >= ?
+                              GROUP BY grade_code ORDER BY grade_code""", (gym_name, _month_start(since)))
+
+    def _monthly_tops(self, gym_name, since, username=None):
+        return self._query(f"""
+            SELECT substr(climbs.climb_date, 1, 7), climbs.grade_code / 100, sessions.username, MAX(climbs.grade_code % 100)
+            FROM climbs JOIN sessions ON sessions.session_id = climbs.session_id
+            WHERE climbs.gym_name = ? AND climbs.sent AND climbs.grade_code IS NOT NULL AND climbs.climb_date >= ?
+              {'AND sessions.username = ?' if username else ''}
+            GROUP BY 1, 2, 3 ORDER BY 1, 2
+        """, (gym_name, _month_start(since)) + ((username,) if username else ()))
+
+    def gym_levels(self, gym_name, since):
+        tops = {}
+        for month, prefix, _, top in self._monthly_tops(gym_name, since):
+            tops.setdefault((date.fromisoformat(month + '-01'), prefix), []).append(top)
+        return [key + (len(values), _percentile(values, 0.5), _percentile(values, 0.9))
+                for key, values in sorted(tops.items())]
+
+    def user_monthly_tops(self, username, gym_name, since):
+        return [(date.fromisoformat(month + '-01'), prefix, top)
+                for month, prefix, _, top in self._monthly_tops(gym_name, since, username)]
+
+    def close_stale_sessions(self, cutoff):
+        conn = self.connect()
+        try:
+            with conn:
+                return conn.execute("UPDATE sessions SET state = 'ended' WHERE state = 'active' AND start_time < ?",
+                                    (cutoff,)).rowcount
+        finally:
+            conn.close()
+
+    def purge_empty_sessions(self, cutoff, draft_cutoff):
+        conn = self.connect()
+        try:
+            with conn:
+                sessions = conn.execute("""DELETE FROM sessions
+                                         WHERE ((state = 'ended' AND start_time < ?) OR (state = 'draft' AND start_time < ?))
+                                           AND NOT EXISTS (SELECT 1 FROM climbs WHERE climbs.session_id = sessions.session_id)""",
+                                      (cutoff, draft_cutoff)).rowcount
+        finally:
+            conn.close()
+        return {'sessions': sessions}
+
+    def load_history(self, sessions, batch_size=500):
+        self.migrate()
+        conn = self.connect()
+        climb_count = 0
+        try:
+            with conn:
+                for s in sessions:
+                    session_id = conn.execute(
+                        """INSERT INTO sessions (username, start_time, end_time, gym_name, duration)
+                           VALUES (?, ?, ?, ?, ?)""",
+                        (s['username'], s['start_time'], s['end_time'], s['gym_name'], s['duration'])).lastrowid
+                    conn.executemany(
+                        f"""INSERT INTO climbs (session_id, {', '.join(HISTORY_CLIMB_COLUMNS)})
+                            VALUES (?, {', '.join('?' * len(HISTORY_CLIMB_COLUMNS))})""",
+                        [(session_id,) + tuple(climb[col] for col in HISTORY_CLIMB_COLUMNS) for climb in s['climbs']])
+                    climb_count += len(s['climbs'])
+        finally:
+            conn.close()
+        return len(sessions), climb_count
+
+    def delete_users(self, prefix):
+        pattern = prefix.replace('_', r'\_') + r'\_%'
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(r"""DELETE FROM climbs
+                                  WHERE session_id IN (SELECT session_id FROM sessions WHERE username LIKE ? ESCAPE '\')""",
+                             (pattern,))
+                conn.execute(r"DELETE FROM sessions WHERE username LIKE ? ESCAPE '\'", (pattern,))
+        finally:
+            conn.close()
+
+_backends = {'postgres': PostgresRepository, 'sqlite': SQLiteRepository}
+_repository = None
+_lock = threading.Lock()
+
+def get_repository():
+    global _repository
+    if _repository is None:
+        with _lock:
+            if _repository is None:
+                config = dict(st.secrets.get("storage", {}))
+                backend = config.pop("backend", "postgres")
+                _repository = _backends[backend](**config)
+    return _repository
@@ -0,0 +1,117 @@
+import argparse
+import json
+
+# Per-user weekly totals keyed by ISO year and week, kept up to date as climbs and sessions are written
+ROLLUP_COLUMNS = ['iso_year', 'iso_week', 'total_minutes', 'climb_count', 'sends', 'grade_histogram']
+
+def iso_week(value):
+    iso = value.isocalendar()
+    return iso[0], iso[1]
+
+# Add climbs, given as (username, climb_date, grade, sent), to their weeks: counted per week in
+# Python first, then written with one multi-row upsert whatever the batch size
+def record_climbs(c, climbs):
+    from psycopg2.extras import execute_values
+
+    weeks = {}
+    for username, climb_date, grade, sent in climbs:
+        week = weeks.setdefault((username,) + iso_week(climb_date), [0, 0, {}])
+        week[0] += 1
+        week[1] += 1 if sent else 0
+        if grade is not None:
+            week[2][grade] = week[2].get(grade, 0) + 1
+    if not weeks:
+        return
+    execute_values(c, """
+        INSERT INTO weekly_rollups (username, iso_year, iso_week, climb_count, sends, grade_histogram) VALUES %s
+        ON CONFLICT (username, iso_year, iso_week) DO UPDATE SET
+            climb_count = weekly_rollups.climb_count + EXCLUDED.climb_count,
+            sends = weekly_rollups.sends + EXCLUDED.sends,
+            grade_histogram = weekly_rollups.grade_histogram || COALESCE((
+                SELECT jsonb_object_agg(grade, COALESCE((weekly_rollups.grade_histogram ->> grade)::int, 0) + added_count::int)
+                FROM jsonb_each_text(EXCLUDED.grade_histogram) AS added (grade, added_count)), '{}'::jsonb)
+    """, [key + (count, sends, json.dumps(histogram)) for key, (count, sends, histogram) in weeks.items()],
+        template="(%s, %s, %s, %s, %s, %s::jsonb)")
+
+def record_session_end(c, username, start_time, duration_seconds):
+    year, week = iso_week(start_time)
+    c.execute("""
+        INSERT INTO weekly_rollups (username, iso_year, iso_week, total_minutes)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (username, iso_year, iso_week) DO UPDATE SET
+            total_minutes = weekly_rollups.total_minutes + EXCLUDED.total_minutes
+    """, (username, year, week, duration_seconds / 60.0))
+
+def get_weekly_rollups(username, c):
+    c.execute(f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM weekly_rollups WHERE username = %s ORDER BY iso_year, iso_week",
+              (username,))
+    return c.fetchall()
+
+# Recompute the rollups from sessions and climbs, for one user or everybody
+def rebuild(conn, c, username=None):
+    c.execute("DELETE FROM weekly_rollups WHERE (%(username)s IS NULL OR username = %(username)s)",
+              {'username': username})
+    c.execute("""
+        WITH climb_weeks AS (
+            SELECT sessions.username,
+                   EXTRACT(ISOYEAR FROM climbs.climb_date)::int AS iso_year,
+                   EXTRACT(WEEK FROM climbs.climb_date)::int AS iso_week,
+                   climbs.grade,
+                   climbs.sent
+            FROM climbs
+            JOIN sessions ON sessions.session_id = climbs.session_id
+            WHERE climbs.climb_date IS NOT NULL
+              AND (%(username)s IS NULL OR sessions.username = %(username)s)
+        ),
+        grade_counts AS (
+            SELECT username, iso_year, iso_week, grade,
+                   COUNT(*) AS climb_count,
+                   COUNT(*) FILTER (WHERE sent) AS sends
+            FROM climb_weeks
+            GROUP BY username, iso_year, iso_week, grade
+        ),
+        climb_totals AS (
+            SELECT username, iso_year, iso_week,
+                   SUM(climb_count) AS climb_count,
+                   SUM(sends) AS sends,
+                   jsonb_object_agg(grade, climb_count) FILTER (WHERE grade IS NOT NULL) AS grade_histogram
+            FROM grade_counts
+            GROUP BY username, iso_year, iso_week
+        ),
+        session_totals AS (
+            SELECT username,
+                   EXTRACT(ISOYEAR FROM start_time)::int AS iso_year,
+                   EXTRACT(WEEK FROM start_time)::int AS iso_week,
+                   SUM(duration) / 60.0 AS total_minutes
+            FROM sessions
+            WHERE duration IS NOT NULL
+              AND (%(username)s IS NULL OR username = %(username)s)
+            GROUP BY 1, 2, 3
+        )
+        INSERT INTO weekly_rollups (username, iso_year, iso_week, total_minutes, climb_count, sends, grade_histogram)
+        SELECT COALESCE(climb_totals.username, session_totals.username),
+               COALESCE(climb_totals.iso_year, session_totals.iso_year),
+               COALESCE(climb_totals.iso_week, session_totals.iso_week),
+               COALESCE(session_totals.total_minutes, 0),
+               COALESCE(climb_totals.climb_count, 0),
+               COALESCE(climb_totals.sends, 0),
+               COALESCE(climb_totals.grade_histogram, '{}'::jsonb)
+        FROM climb_totals
+        FULL JOIN session_totals
+          ON session_totals.username = climb_totals.username
+         AND session_totals.iso_year = climb_totals.iso_year
+         AND session_totals.iso_week = climb_totals.iso_week
+    """, {'username': username})
+    rows = c.rowcount
+    conn.commit()
+    return rows
+
+if __name__ == '__main__':
+    from db_singleton import db_cursor
+
+    parser = argparse.ArgumentParser(description="Rebuild the weekly_rollups table from sessions and climbs")
+    parser.add_argument('--username', help="Only rebuild this user's weeks")
+    args = parser.parse_args()
+    with db_cursor() as (conn, c):
+        count = rebuild(conn, c, args.username)
+    print(f"Rebuilt {count} weekly rollup rows.")
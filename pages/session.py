@@ -1,6 +1,15 @@
 import streamlit as st
 from datetime import datetime
-from db_singleton import get_db, create_tables_if_not_exist, close_db
+from blob_store import get_blob_store
+import write_queue
+import photo_worker
+import query_cache
+from instrumentation import timed_page
+from grades import GYM_NAMES, JUDGMENTS, grade_options as gym_grade_options, encode_grade, discipline
+
+ENTRY_MODES = ['One climb', 'Batch grid']
+BATCH_COLUMNS = ['climb_name', 'grade', 'grade_judgment', 'num_attempts', 'sent', 'star_rating', 'notes']
+DEFAULT_AUTOSAVE_ROWS = 5
 
 # Function to initialize session state variables
 def initialize_session_state():
@@ -15,14 +24,12 @@ def initialize_session_state():
     st.session_state.setdefault('star_rating', 0) 
     st.session_state.setdefault('notes', '')
     st.session_state.setdefault('sent', False)
-    st.session_state.setdefault('start_time', datetime.now())
     st.session_state.setdefault('end_session', False)
      # Initialize star_rating
 
 # Display the app here
-def app(conn, c, username=None):
+def app(repo, username=None):
     initialize_session_state()
-    custom_css()
     if username:
         st.session_state['username'] = username
     elif 'username' in st.session_state and st.session_state['username']:
@@ -32,70 +39,128 @@ def app(conn, c, username=None):
         return
     
     if st.session_state['session_page'] == 'choose_gym':
-        choose_gym(conn, c)
+        choose_gym(repo)
     elif st.session_state['session_page'] == 'enter_climbs':
-        enter_climbs(conn, c)
+        enter_climbs(repo)
     elif st.session_state['session_page'] == 'summary':
-        session_summary(conn, c)
+        session_summary(repo)
 
-def choose_gym(conn, c):
+@timed_page
+def choose_gym(repo):
     username = st.session_state['username']
-    gym_options = ['VE Minneapolis', 'VE Bloomington', 'VE St.Paul', 'VE TCB', 'MBP']
+    gym_options = GYM_NAMES
     st.session_state['gym_name'] = st.selectbox("Choose a Gym", gym_options, index=0)
-    
-    if st.session_state['session_id'] is None:
-        start_time = st.session_state['start_time']
-        gym_name = st.session_state['gym_name']
-        c.execute("INSERT INTO sessions (username, start_time, gym_name) VALUES (%s, %s, %s) RETURNING session_id",
-                  (username, start_time, gym_name))
-        conn.commit()
-        result = c.fetchone()
-        if result is not None:
-            st.session_state['session_id'] = result[0]
-        
+    # The recommender pulls in NumPy, so it only loads once the user asks for a plan
+    if st.checkbox("Suggest a session plan", key='show_session_targets'):
+        show_session_targets(repo, username, st.session_state['gym_name'])
+
+    # The session row is only created once the user actually starts climbing
     if st.button("Start Session"):
+        st.session_state['start_time'] = datetime.now()
+        st.session_state['session_id'] = repo.create_session(username, st.session_state['start_time'], st.session_state['gym_name'])
+        st.session_state['batch_rows'] = []
+        st.session_state['batch_saved'] = 0
+        query_cache.bump_version(username)
         st.session_state['session_page'] = 'enter_climbs'
         st.rerun()
-        close_db()
 
-def enter_climbs(conn, c):
-    # Check if 'start_time' is initialized in session_state
-    if 'start_time' not in st.session_state:
+# Suggested grades for today's session from the recommender, if there is enough history
+def show_session_targets(repo, username, gym_name):
+    import recommender
+
+    plan = recommender.recommendations(repo, username)['targets'].get(gym_name)
+    if plan:
+        st.markdown("**Suggested session:** " + ", ".join(
+            f"{target['climbs']} × {target['grade']} ({target['purpose']})" for target in plan))
+    else:
+        st.caption("Not enough recent sends at this gym for a suggestion yet.")
+
+@timed_page
+def enter_climbs(repo):
+    # Check that a session was started from the gym page
+    if st.session_state.get('session_id') is None or 'start_time' not in st.session_state:
         st.error("Session start time not initialized. Please start a new session.")
         return
     username = st.session_state['username']
-    if st.session_state.gym_name in ['VE Minneapolis', 'VE Bloomington', 'VE St.Paul']:
-        grade_options = ['5.6', '5.7', '5.8', '5.9', '5.10-', '5.10+', '5.11-', '5.11+', '5.12-', '5.12+', 'VB', 'V1-2', 'V2-3', 'V4-5', 'V5-6', 'V7-8', 'V9-10', 'V11']
-    elif st.session_state.gym_name == 'VE TCB':
-        grade_options = ['VB', 'V1-2', 'V2-3', 'V4-5', 'V5-6', 'V7-8', 'V9-10', 'V11']
-    elif st.session_state.gym_name == 'MBP':
-        grade_options = ['Yellow', 'Red', 'Green', 'Purple', 'Orange', 'Black', 'Blue', 'Pink', 'White']
+    grade_options = gym_grade_options(st.session_state.gym_name)
 
+    # The grid logs many climbs per rerun; the form keeps photo uploads
+    entry_mode = st.radio("Entry mode", ENTRY_MODES, horizontal=True, key='entry_mode')
+    unsaved = []
+    if entry_mode == 'Batch grid':
+        unsaved = batch_entry(repo, username, grade_options)
+    else:
+        single_entry(repo, username, grade_options)
+
+    st.session_state.end_session = st.checkbox("End Session", value=st.session_state.end_session)
+    if st.session_state.end_session:
+        # Valid grid rows that have not been autosaved yet go in before the session end
+        if unsaved:
+            save_batch(repo, username, unsaved)
+        else:
+            ensure_session(repo, username)
+        end_time = datetime.now()
+        start_time = st.session_state.start_time
+        duration = (end_time - start_time).seconds
+        # Goes through the same queue so it lands after this session's climbs
+        write_queue.enqueue_session_end(username, st.session_state.session_id, start_time, end_time, duration)
+        query_cache.bump_version(username)
+        # Give the flusher a moment so the summary includes everything just logged
+        write_queue.flush_now(timeout=5)
+        st.session_state['session_page'] = 'summary'
+        st.session_state.end_session = False
+        st.rerun()
+
+# The compactor deletes drafts that never got a climb once they are old enough, while a browser
+# may still have one open. Check before queueing writes for it and start a fresh row if it is gone.
+def ensure_session(repo, username):
+    if not repo.session_exists(st.session_state.session_id):
+        st.session_state.session_id = repo.create_session(username, st.session_state.start_time, st.session_state.gym_name)
+
+# Fields shared by every climb of the current session, plus the registry-derived type and code
+def climb_record(fields):
+    gym_name = st.session_state.gym_name
+    return dict(fields,
+        session_id=st.session_state.session_id,
+        climb_date=st.session_state.start_time.date(),
+        gym_name=gym_name,
+        grade_code=encode_grade(gym_name, fields['grade']),
+        type=discipline(gym_name, fields['grade']))
+
+def single_entry(repo, username, grade_options):
     if st.session_state.grade not in grade_options:
         st.session_state.grade = grade_options[0]
 
     uploaded_file = st.file_uploader("Upload a photo of your climb (Optional)", type=["jpg", "png", "jpeg"])
-    file_bytes = uploaded_file.read() if uploaded_file else None
+    file_bytes = uploaded_file.getvalue() if uploaded_file else None
     st.session_state.climb_name = st.text_input("Climb name", value=st.session_state.climb_name)
     st.session_state.grade = st.selectbox("Grade", grade_options, index=grade_options.index(st.session_state.grade))
-    st.session_state.grade_judgment = st.selectbox("Grade Judgment", ["Soft", "On", "Hard"], index=["Soft", "On", "Hard"].index(st.session_state.grade_judgment))
+    st.session_state.grade_judgment = st.selectbox("Grade Judgment", JUDGMENTS, index=JUDGMENTS.index(st.session_state.grade_judgment))
     st.session_state.num_attempts = st.number_input("Number of Attempts", min_value=1, max_value=100, step=1, value=st.session_state.num_attempts)
     st.session_state.star_rating = st.slider("Star Rating", min_value=0, max_value=5, step=1, value=st.session_state.star_rating)
     st.session_state.notes = st.text_input("Notes", value=st.session_state.notes)
     # st.session_state.star_rating = st.number_input("Star Rating", min_value=0, max_value=5, step=1, value=st.session_state.star_rating)
-    climb_date = st.session_state.start_time.date()
 
     st.session_state.sent = st.checkbox("Sent", value=st.session_state.sent)
 
-    # Determine the type based on the grade
-    climb_type = 'Sport' if st.session_state.grade.startswith('5') else 'Boulder'
-
     if st.button("Submit", key='submit_button'):
         try:
-            # Execute the SQL query
-            c.execute("INSERT INTO climbs (session_id, photo, climb_date, climb_name, gym_name, grade, grade_judgment, num_attempts, sent, notes, star_rating, type) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                    (st.session_state.session_id, file_bytes, climb_date, st.session_state.climb_name, st.session_state.gym_name, st.session_state.grade, st.session_state.grade_judgment, st.session_state.num_attempts, st.session_state.sent, st.session_state.notes, st.session_state.star_rating, climb_type))
-            conn.commit()
+            # Keep the raw upload locally; the photo worker re-encodes it after the form returns
+            photo = photo_worker.store_upload(file_bytes) if file_bytes else {}
+
+            # Queue the climb locally; the background flusher writes it to the database
+            ensure_session(repo, username)
+            client_id = write_queue.enqueue_climb(username, climb_record(dict(photo,
+                climb_name=st.session_state.climb_name,
+                grade=st.session_state.grade,
+                grade_judgment=st.session_state.grade_judgment,
+                num_attempts=st.session_state.num_attempts,
+                sent=st.session_state.sent,
+                notes=st.session_state.notes,
+                star_rating=st.session_state.star_rating)))
+            if file_bytes:
+                photo_worker.submit(username, client_id, photo['photo_key'])
+            query_cache.bump_version(username)
 
             # Reset session state variables
             st.session_state.climb_name = ""
@@ -110,87 +175,164 @@ def enter_climbs(conn, c):
             # Debugging Step 2: Print exception details
             st.error(f"An error occurred: {e}")
 
+def _blank(value):
+    return value is None or value != value or (isinstance(value, str) and not value.strip())
 
-    st.session_state.end_session = st.checkbox("End Session", value=st.session_state.end_session)
-    if st.session_state.end_session:
-        end_time = datetime.now()
-        start_time = st.session_state.start_time
-        duration = (end_time - start_time).seconds
-        c.execute("UPDATE sessions SET end_time = %s, duration = %s WHERE session_id = %s", (end_time, duration, st.session_state.session_id))
-        conn.commit()
-        st.session_state['session_page'] = 'summary'
-        st.session_state.end_session = False
+# Check one grid row against the gym's grade list; returns (climb fields, error message)
+def validate_batch_row(row, grade_options):
+    if _blank(row.get('grade')):
+        return None, "choose a grade"
+    if row['grade'] not in grade_options:
+        return None, f"{row['grade']} is not a grade at {st.session_state.gym_name}"
+    judgment = 'On' if _blank(row.get('grade_judgment')) else row['grade_judgment']
+    if judgment not in JUDGMENTS:
+        return None, f"grade judgment must be one of {', '.join(JUDGMENTS)}"
+    attempts = 1 if _blank(row.get('num_attempts')) else row['num_attempts']
+    if not 1 <= attempts <= 100 or int(attempts) != attempts:
+        return None, "attempts must be a whole number from 1 to 100"
+    stars = 0 if _blank(row.get('star_rating')) else row['star_rating']
+    if not 0 <= stars <= 5 or int(stars) != stars:
+        return None, "star rating must be a whole number from 0 to 5"
+    # Plain Python values, so the row can be queued as JSON
+    return {
+        'climb_name': '' if _blank(row.get('climb_name')) else str(row['climb_name']),
+        'grade': row['grade'],
+        'grade_judgment': judgment,
+        'num_attempts': int(attempts),
+        'sent': bool(row.get('sent')) if not _blank(row.get('sent')) else False,
+        'notes': '' if _blank(row.get('notes')) else str(row['notes']),
+        'star_rating': int(stars),
+    }, None
+
+# All rows go into the local queue in one transaction and reach the database as one multi-row insert
+def save_batch(repo, username, climbs):
+    ensure_session(repo, username)
+    write_queue.enqueue_climbs(username, [climb_record(climb) for climb in climbs])
+    query_cache.bump_version(username)
+    st.session_state.batch_saved += len(climbs)
+
+# Editable grid of climbs. Valid rows are saved every AUTOSAVE_ROWS climbs or on "Save climbs";
+# anything incomplete or invalid stays in the grid. Returns the valid rows not saved yet.
+def batch_entry(repo, username, grade_options):
+    import pandas as pd
+
+    st.session_state.setdefault('batch_rows', [])
+    st.session_state.setdefault('batch_editor', 0)
+    st.session_state.setdefault('batch_saved', 0)
+    autosave_rows = int(st.secrets.get("batch_entry", {}).get("autosave_rows", DEFAULT_AUTOSAVE_ROWS))
+
+    edited = st.data_editor(
+        pd.DataFrame(st.session_state.batch_rows, columns=BATCH_COLUMNS),
+        key=f"batch_editor_{st.session_state.batch_editor}",
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'climb_name': st.column_config.TextColumn("Climb name"),
+            'grade': st.column_config.SelectboxColumn("Grade", options=grade_options, required=True),
+            'grade_judgment': st.column_config.SelectboxColumn("Grade Judgment", options=JUDGMENTS, default='On'),
+            'num_attempts': st.column_config.NumberColumn("Attempts", min_value=1, max_value=100, step=1, default=1),
+            'sent': st.column_config.CheckboxColumn("Sent", default=False),
+            'star_rating': st.column_config.NumberColumn("Stars", min_value=0, max_value=5, step=1, default=0),
+            'notes': st.column_config.TextColumn("Notes"),
+        },
+    )
+
+    ready, keep = [], []
+    for number, row in enumerate(edited.to_dict('records'), start=1):
+        if all(_blank(row.get(col)) for col in BATCH_COLUMNS if col != 'sent'):
+            continue
+        climb, error = validate_batch_row(row, grade_options)
+        if error:
+            keep.append(row)
+            st.warning(f"Row {number}: {error}")
+        else:
+            ready.append(climb)
+
+    save_clicked = st.button("Save climbs", key='save_batch_button', disabled=not ready)
+    st.caption(f"{len(ready)} climb(s) ready · {st.session_state.batch_saved} saved this session · "
+               f"saved automatically every {autosave_rows}")
+    if ready and (save_clicked or len(ready) >= autosave_rows):
+        save_batch(repo, username, ready)
+        # A fresh editor key redraws the grid with only the rows that still need fixing
+        st.session_state.batch_rows = [{col: (None if _blank(row.get(col)) else row[col]) for col in BATCH_COLUMNS} for row in keep]
+        st.session_state.batch_editor += 1
         st.rerun()
-        close_db()
+    return ready
 
-def session_summary(conn, c):
+def show_session_photos(repo, username, session_id):
+    photos = query_cache.cached('session_photos', username, lambda: repo.session_photos(session_id), session_id)
+    if not photos:
+        st.write("No photos in this session.")
+        return
+    store = get_blob_store()
+    cols = st.columns(4)
+    for i, (climb_name, grade, status, thumb_key, photo_key) in enumerate(photos):
+        col = cols[i % 4]
+        if status == 'pending':
+            col.caption(f"{climb_name} ({grade}): processing…")
+        elif status == 'failed':
+            col.caption(f"{climb_name} ({grade}): photo could not be processed")
+        else:
+            # Photos from before processing existed have no thumbnail; fall back to the stored image
+            try:
+                col.image(store.get(thumb_key or photo_key), caption=f"{climb_name} ({grade})", use_column_width=True)
+            except FileNotFoundError:
+                col.caption(f"{climb_name} ({grade}): photo missing from the blob store")
+
+@timed_page
+def session_summary(repo):
     username = st.session_state['username']
     st.header("Session Summary")
 
     # Create columns for better layout
     col1, col2 = st.columns(2)
 
-    # Query and display the total number of climbs
-    c.execute("SELECT COUNT(*) FROM climbs WHERE session_id = %s", (st.session_state.session_id,))
-    count_of_climbs = c.fetchone()[0]
-    col1.markdown(f"**Total Climbs:** {count_of_climbs}")
+    pending = write_queue.pending_count()
+    if pending:
+        st.info(f"{pending} climb(s) still waiting to be saved; the summary will update once they are written.")
+
+    session_id = st.session_state.session_id
+    summary = query_cache.cached('session_summary', username, lambda: repo.session_summary(session_id), session_id)
+    if summary is None:
+        st.error("Session not found.")
+        return
+
+    # Display the total number of climbs
+    col1.markdown(f"**Total Climbs:** {summary['total_climbs']}")
 
-    # Query and display the most frequent grade
-    c.execute("SELECT grade, COUNT(grade) FROM climbs WHERE session_id = %s GROUP BY grade ORDER BY COUNT(grade) DESC LIMIT 1", (st.session_state.session_id,))
-    most_frequent_grade = c.fetchone()
-    if most_frequent_grade:
-        col1.markdown(f"**Most Frequent Grade:** {most_frequent_grade[0]} (Count: {most_frequent_grade[1]})")
+    # Display the most frequent grade
+    if summary['top_grade']:
+        col1.markdown(f"**Most Frequent Grade:** {summary['top_grade']} (Count: {summary['top_grade_count']})")
     else:
         col1.markdown("**Most Frequent Grade:** N/A")
-    
-    # Query and display the average number of attempts
-    c.execute("SELECT AVG(num_attempts) FROM climbs WHERE session_id = %s", (st.session_state.session_id,))
-    avg_attempts = c.fetchone()[0]
+
+    # Display the average number of attempts
+    avg_attempts = summary['avg_attempts']
     if avg_attempts:
         col1.markdown(f"**Average Attempts:** {round(avg_attempts, 2)}")
     else:
         col1.markdown("**Average Attempts:** N/A")
 
-    # Query and display the session length
-    c.execute("SELECT start_time, end_time FROM sessions WHERE session_id = %s", (st.session_state.session_id,))
-    times = c.fetchone()
-    if times and times[0] and times[1]:
-        start_time = times[0]
-        end_time = times[1]
-        duration = (end_time - start_time).seconds
+    # Display the session length
+    if summary['start_time'] and summary['end_time']:
+        duration = (summary['end_time'] - summary['start_time']).seconds
         col1.markdown(f"**Session Length:** {duration//60} minutes {duration%60} seconds")
     else:
         col1.markdown("**Session Length:** N/A")
 
-    # Query and display the list of climbs with star ratings
-    c.execute("SELECT climb_name, grade, grade_judgment, star_rating FROM climbs WHERE session_id = %s", (st.session_state.session_id,))
-    climbs = c.fetchall()
+    # Display the list of climbs with star ratings
     st.subheader("List of Climbs")
-    for climb in climbs:
+    for climb in summary['climbs']:
         st.markdown(f"- **Climb Name:** {climb[0]}, **Grade:** {climb[1]}, **Judgment:** {climb[2]}, **Star Rating:** {climb[3]}")
+
+    # Thumbnails are only read from the blob store when asked for
+    if st.checkbox("Show photos", key='show_photos'):
+        show_session_photos(repo, username, session_id)
+
     # Button to go back to the start
     if st.button("Go Back to Start", key='go_back_button'):
         st.session_state['session_id'] = None
+        st.session_state.pop('start_time', None)
         st.session_state['session_page'] = 'choose_gym'
         st.rerun()
-        close_db()
-
-def custom_css():
-    st.markdown(
-        """
-        <style>
-            /* Change the slider line thickness and color */
-            div[data-baseweb="slider"] > div > div {
-                height: 8px !important;
-                background-color: yellow !important;
-            }
-            /* Change the slider thumb size and color */
-            div[role="slider"] {
-                width: 20px !important;
-                height: 20px !important;
-                background-color: yellow !important;
-            }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
@@ -0,0 +1,65 @@
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+import streamlit as st
+import write_queue
+
+# Sessions go draft -> active -> ended: "Start Session" creates a draft, the first logged climb
+# makes it active and "End Session" ends it. This job closes sessions left active for too long
+# and deletes old sessions that never got a climb (abandoned visits, pre-lifecycle orphans).
+# Drafts are only deleted after draft_days, since a browser may still have one open.
+DEFAULT_STALE_HOURS = 12
+DEFAULT_DRAFT_DAYS = 7
+DEFAULT_INTERVAL_MINUTES = 60
+
+_compactor = None
+_status = {'runs': 0, 'last_run': None, 'last_report': None, 'last_error': None}
+
+def _config():
+    return st.secrets.get("sessions", {})
+
+def compact(repo, stale_hours=None):
+    stale_hours = stale_hours if stale_hours is not None else float(_config().get("stale_hours", DEFAULT_STALE_HOURS))
+    now = datetime.now()
+    cutoff = now - timedelta(hours=stale_hours)
+    draft_cutoff = now - timedelta(days=float(_config().get("draft_days", DEFAULT_DRAFT_DAYS)))
+    report = {'closed_sessions': repo.close_stale_sessions(cutoff)}
+    report.update({f'purged_{table}': rows for table, rows in repo.purge_empty_sessions(cutoff, draft_cutoff).items()})
+    return report
+
+def _run(repo, interval):
+    while True:
+        try:
+            # Queued climbs may still belong to a draft; leave everything alone until they land
+            if not write_queue.pending_count():
+                _status['last_report'] = compact(repo)
+                _status['runs'] += 1
+                _status['last_run'] = time.time()
+            _status['last_error'] = None
+        except Exception as e:
+            _status['last_error'] = str(e)
+        time.sleep(interval)
+
+def start_compactor(repo):
+    global _compactor
+    if _compactor is None or not _compactor.is_alive():
+        interval = float(_config().get("compact_interval_minutes", DEFAULT_INTERVAL_MINUTES)) * 60
+        _compactor = threading.Thread(target=_run, args=(repo, interval), name='climb-session-compactor', daemon=True)
+        _compactor.start()
+
+def status():
+    return dict(_status)
+
+if __name__ == '__main__':
+    from repository import get_repository
+
+    parser = argparse.ArgumentParser(description="Close stale sessions and purge sessions without climbs")
+    parser.add_argument('--stale-hours', type=float, default=None)
+    args = parser.parse_args()
+    if write_queue.pending_count():
+        raise SystemExit("Writes are still queued locally; run again once they have been flushed.")
+    repo = get_repository()
+    repo.migrate()
+    report = compact(repo, args.stale_hours)
+    print(', '.join(f"{name.replace('_', ' ')}: {rows}" for name, rows in report.items()))
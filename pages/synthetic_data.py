@@ -0,0 +1,71 @@
+import random
+from datetime import datetime, timedelta
+from grades import GYM_NAMES, GYM_SCALES, SCALES, encode_grade, discipline
+
+# Seeded generator of realistic climbing history, for benchmarks and local testing.
+# Every user gets a home gym, an ability that improves over the years, and sessions
+# whose climbs cluster around that ability with fewer sends as grades get harder.
+ADJECTIVES = ['Crimpy', 'Slopey', 'Pumpy', 'Balancy', 'Dynamic', 'Techy', 'Juggy', 'Steep', 'Sketchy', 'Classic']
+NOUNS = ['Overhang', 'Arete', 'Dihedral', 'Roof', 'Slab', 'Crack', 'Traverse', 'Prow', 'Corner', 'Project']
+NOTES = ['', '', '', 'Felt strong', 'Flash attempt', 'Heel hook beta', 'Fell at the crux', 'Reset soon', 'Great movement']
+
+def _scale_grades(gym_name, rng):
+    scale = rng.choice(GYM_SCALES[gym_name])
+    return SCALES[scale][2]
+
+def generate_user(username, years=5, sessions_per_week=3.0, climbs_per_session=(4, 14), seed=0, end=None):
+    rng = random.Random(f"{seed}:{username}")
+    end = end or datetime(2024, 1, 1)
+    start = end - timedelta(days=int(365 * years))
+    home_gym = rng.choice(GYM_NAMES)
+    # Ability as a fraction of each grade list, growing from beginner to intermediate
+    ability_start = rng.uniform(0.05, 0.3)
+    ability_end = min(0.9, ability_start + rng.uniform(0.2, 0.5))
+    total_days = (end - start).days
+
+    day = start
+    while day < end:
+        day += timedelta(days=max(1, int(rng.expovariate(sessions_per_week / 7.0) + 0.5)))
+        if day >= end:
+            break
+        gym_name = home_gym if rng.random() < 0.75 else rng.choice(GYM_NAMES)
+        progress = (day - start).days / total_days
+        ability = ability_start + (ability_end - ability_start) * progress
+        start_time = day.replace(hour=rng.choice([6, 11, 16, 17, 18, 19, 20]), minute=rng.randrange(60))
+        minutes = max(20, int(rng.gauss(95, 25)))
+        end_time = start_time + timedelta(minutes=minutes)
+
+        climbs = []
+        for _ in range(rng.randint(*climbs_per_session)):
+            grades = _scale_grades(gym_name, rng)
+            target = ability * (len(grades) - 1)
+            index = min(len(grades) - 1, max(0, int(round(rng.gauss(target, 1.2)))))
+            grade = grades[index]
+            # Sends get less likely the further a climb sits above current ability
+            send_chance = max(0.05, min(0.95, 0.8 - 0.25 * (index - target)))
+            sent = rng.random() < send_chance
+            climbs.append({
+                'climb_date': start_time.date(),
+                'climb_name': f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}",
+                'gym_name': gym_name,
+                'grade': grade,
+                'grade_code': encode_grade(gym_name, grade),
+                'type': discipline(gym_name, grade),
+                'grade_judgment': rng.choices(['Soft', 'On', 'Hard'], weights=[2, 6, 2])[0],
+                'num_attempts': 1 + int(rng.expovariate(0.6 if sent else 0.3)),
+                'sent': sent,
+                'notes': rng.choice(NOTES),
+                'star_rating': rng.choices(range(6), weights=[1, 2, 4, 6, 4, 2])[0],
+            })
+        yield {
+            'username': username,
+            'gym_name': gym_name,
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration': minutes * 60,
+            'climbs': climbs,
+        }
+
+def generate(users=1, years=5, sessions_per_week=3.0, climbs_per_session=(4, 14), seed=0, prefix='synthetic_user'):
+    for number in range(users):
+        yield from generate_user(f"{prefix}_{number}", years, sessions_per_week, climbs_per_session, seed)
@@ -0,0 +1,105 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+from grades import CODE_LABELS, JUDGMENTS, SCALE_BY_PREFIX
+from repository import TRAINING_COLUMNS
+
+# Training metrics for one user from a narrow, typed climb frame. Every weekly series comes
+# out of one set of np.bincount calls over a week index, so the cost is one pass over the
+# climbs plus one per week; nothing loops over rows in Python.
+ROLLING_WEEKS = 4
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+WEEKLY_COLUMNS = ['week', 'climbs', 'sends', 'flashes', 'attempts', 'load', 'send_rate', 'flash_rate',
+                  'attempts_per_send', 'avg_stars', 'soft', 'hard', 'rolling_load']
+
+# About 15 bytes per climb: a date, small ints, a bool and a categorical
+def climb_frame(rows):
+    values = {col: [row[i] for row in rows] for i, col in enumerate(TRAINING_COLUMNS)}
+    return pd.DataFrame({
+        # Converting date objects one by one in NumPy is slow; ordinals are a cheap C call each
+        'climb_date': (np.fromiter(map(date.toordinal, values['climb_date']), dtype=np.int64,
+                                   count=len(values['climb_date'])) - EPOCH_ORDINAL).astype('datetime64[D]'),
+        # Climbs from before the grade registry have no code; 0 keeps them out of the pyramid
+        'grade_code': np.nan_to_num(np.array(values['grade_code'], dtype=float)).astype(np.int16),
+        'num_attempts': np.nan_to_num(np.array(values['num_attempts'], dtype=float), nan=1).astype(np.int16),
+        'sent': np.array(values['sent'], dtype=bool),
+        'star_rating': np.nan_to_num(np.array(values['star_rating'], dtype=float)).astype(np.int8),
+        'grade_judgment': pd.Categorical(values['grade_judgment'], categories=JUDGMENTS),
+    })
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+# Weekly series, grade pyramid and overall totals for a climb_frame
+def compute(frame):
+    if frame.empty:
+        return {'weekly': pd.DataFrame(columns=WEEKLY_COLUMNS),
+                'pyramid': pd.DataFrame(columns=['grade_code', 'grade', 'scale', 'climbs', 'sends']),
+                'totals': {}}
+
+    days = frame['climb_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    # Day 0 (1970-01-01) was a Thursday; shift back to the Monday of each ISO week
+    mondays = days - (days + 3) % 7
+    first = mondays.min()
+    week_index = (mondays - first) // 7
+    weeks = int(week_index.max()) + 1
+
+    sent = frame['sent'].to_numpy()
+    attempts = frame['num_attempts'].to_numpy().astype(np.int64)
+    codes = frame['grade_code'].to_numpy().astype(np.int64)
+    judgment = frame['grade_judgment'].cat.codes.to_numpy()
+    # Load is attempts weighted by difficulty within the climb's scale (unknown grades count as 1)
+    load = attempts * np.maximum(codes % 100, 1)
+
+    def per_week(weights=None):
+        return np.bincount(week_index, weights=weights, minlength=weeks)
+
+    climbs = per_week()
+    sends = per_week(sent)
+    flashes = per_week(sent & (attempts == 1))
+    weekly_attempts = per_week(attempts)
+    weekly_load = per_week(load)
+    cumulative = np.cumsum(weekly_load)
+    rolling = cumulative - np.concatenate([np.zeros(ROLLING_WEEKS), cumulative[:-ROLLING_WEEKS]])[:weeks]
+
+    weekly = pd.DataFrame({
+        'week': pd.to_datetime((first + 7 * np.arange(weeks)).astype('datetime64[D]')),
+        'climbs': climbs.astype(np.int32),
+        'sends': sends.astype(np.int32),
+        'flashes': flashes.astype(np.int32),
+        'attempts': weekly_attempts.astype(np.int32),
+        'load': weekly_load,
+        'send_rate': _ratio(sends, climbs),
+        'flash_rate': _ratio(flashes, climbs),
+        'attempts_per_send': _ratio(weekly_attempts, sends),
+        'avg_stars': _ratio(per_week(frame['star_rating'].to_numpy()), climbs),
+        'soft': per_week(judgment == JUDGMENTS.index('Soft')).astype(np.int32),
+        'hard': per_week(judgment == JUDGMENTS.index('Hard')).astype(np.int32),
+        'rolling_load': rolling,
+    })
+
+    graded = codes > 0
+    pyramid_codes, inverse = np.unique(codes[graded], return_inverse=True)
+    pyramid = pd.DataFrame({
+        'grade_code': pyramid_codes,
+        'grade': [CODE_LABELS.get(code, str(code)) for code in pyramid_codes],
+        'scale': [SCALE_BY_PREFIX.get(code // 100) for code in pyramid_codes],
+        'climbs': np.bincount(inverse, minlength=len(pyramid_codes)),
+        'sends': np.bincount(inverse, weights=sent[graded], minlength=len(pyramid_codes)).astype(np.int64),
+    })
+
+    total_climbs, total_sends = int(climbs.sum()), int(sends.sum())
+    totals = {
+        'climbs': total_climbs,
+        'sends': total_sends,
+        'send_rate': total_sends / total_climbs,
+        'flash_rate': float(flashes.sum()) / total_climbs,
+        'attempts_per_send': float(weekly_attempts.sum()) / total_sends if total_sends else None,
+        'avg_stars': float(frame['star_rating'].mean()),
+        'judgments': {name: int((judgment == i).sum()) for i, name in enumerate(JUDGMENTS)},
+    }
+    return {'weekly': weekly, 'pyramid': pyramid, 'totals': totals}
+
+def training_metrics(rows):
+    return compute(climb_frame(rows))
@@ -0,0 +1,221 @@
+import atexit
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime
+import streamlit as st
+from repository import get_repository
+
+# Climbs, photo updates and session ends are written to a local SQLite WAL file first, then flushed to
+# the storage backend in batches by a background thread, so the UI never waits on the network.
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'write_queue.sqlite3')
+FLUSH_INTERVAL_SECONDS = 2
+BATCH_SIZE = 200
+MAX_BACKOFF_SECONDS = 300
+
+_flusher = None
+_flush_lock = threading.Lock()
+_exit_hook_registered = False
+_wake = threading.Event()
+_flushed = threading.Condition()
+_status = {'flushed': 0, 'failures': 0, 'dead_lettered': 0, 'last_error': None, 'retry_at': None}
+_listeners = []
+
+# Errors that retrying can't fix (constraint violations, bad values). The operation that raised
+# one is moved to the dead_letters table so it doesn't hold up everything queued behind it.
+PERMANENT_ERRORS = (sqlite3.IntegrityError, sqlite3.DataError)
+try:
+    import psycopg2
+    PERMANENT_ERRORS += (psycopg2.IntegrityError, psycopg2.DataError)
+except ImportError:
+    pass
+
+def _queue_path():
+    return st.secrets.get("write_queue", {}).get("path", DEFAULT_PATH)
+
+def _connect():
+    db = sqlite3.connect(_queue_path(), timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=FULL")
+    db.execute('''CREATE TABLE IF NOT EXISTS pending
+                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  kind TEXT NOT NULL,
+                  payload TEXT NOT NULL,
+                  created_at REAL NOT NULL)''')
+    db.execute('''CREATE TABLE IF NOT EXISTS dead_letters
+                  (id INTEGER PRIMARY KEY,
+                  kind TEXT NOT NULL,
+                  payload TEXT NOT NULL,
+                  created_at REAL NOT NULL,
+                  error TEXT NOT NULL,
+                  failed_at REAL NOT NULL)''')
+    return db
+
+def _encode(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot queue {type(value).__name__}")
+
+def _enqueue_many(kind, payloads):
+    db = _connect()
+    try:
+        with db:
+            db.executemany("INSERT INTO pending (kind, payload, created_at) VALUES (?, ?, ?)",
+                           [(kind, json.dumps(p, default=_encode), time.time()) for p in payloads])
+    finally:
+        db.close()
+    _wake.set()
+
+# Queue climbs for insert. Each gets a client_id so a retried batch is never inserted twice.
+def enqueue_climbs(username, climbs):
+    payloads = [dict(climb, username=username, client_id=climb.get('client_id') or str(uuid.uuid4())) for climb in climbs]
+    _enqueue_many('climb', payloads)
+    return [p['client_id'] for p in payloads]
+
+def enqueue_climb(username, climb):
+    return enqueue_climbs(username, [climb])[0]
+
+def enqueue_session_end(username, session_id, start_time, end_time, duration):
+    _enqueue_many('session_end', [{'username': username, 'session_id': session_id, 'start_time': start_time,
+                                   'end_time': end_time, 'duration': duration}])
+
+# Processed photo keys (or a failed status) for a climb already queued under client_id
+def enqueue_photo(username, client_id, photo):
+    _enqueue_many('photo', [dict(photo, username=username, client_id=client_id)])
+
+def pending_count():
+    db = _connect()
+    try:
+        return db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+    finally:
+        db.close()
+
+def dead_letter_count():
+    db = _connect()
+    try:
+        return db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+    finally:
+        db.close()
+
+# Most recent operations that failed permanently, newest first
+def dead_letters(limit=50):
+    db = _connect()
+    try:
+        rows = db.execute("""SELECT id, kind, payload, error, created_at, failed_at FROM dead_letters
+                             ORDER BY failed_at DESC LIMIT ?""", (limit,)).fetchall()
+    finally:
+        db.close()
+    return [{'id': id, 'kind': kind, 'payload': json.loads(payload), 'error': error,
+             'queued': datetime.fromtimestamp(created_at), 'failed': datetime.fromtimestamp(failed_at)}
+            for id, kind, payload, error, created_at, failed_at in rows]
+
+def status():
+    return dict(_status, pending=pending_count(), dead_letters=dead_letter_count())
+
+# Called with the set of usernames whose data was just committed
+def add_flush_listener(callback):
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+# Write one batch of queued operations to the backend in a single transaction, in queue order
+def flush_once():
+    with _flush_lock:
+        return _flush_batch()
+
+def _flush_batch():
+    db = _connect()
+    users = set()
+    try:
+        rows = db.execute("SELECT id, kind, payload, created_at FROM pending ORDER BY id LIMIT ?", (BATCH_SIZE,)).fetchall()
+        if not rows:
+            return 0
+        operations = [(kind, json.loads(payload)) for _, kind, payload, _ in rows]
+        try:
+            get_repository().apply_writes(operations)
+            with db:
+                db.execute("DELETE FROM pending WHERE id <= ?", (rows[-1][0],))
+            users = {payload['username'] for _, payload in operations}
+        except PERMANENT_ERRORS:
+            # The batch rolled back as a whole; find the bad operations one at a time
+            _flush_one_by_one(db, rows, operations, users)
+    finally:
+        db.close()
+        if users:
+            for callback in _listeners:
+                callback(users)
+    return len(rows)
+
+# Apply each operation on its own; a permanent failure dead-letters just that one. A transient
+# error still propagates, leaving the rest queued for the usual retry.
+def _flush_one_by_one(db, rows, operations, users):
+    repo = get_repository()
+    for (row_id, kind, payload, created_at), operation in zip(rows, operations):
+        try:
+            repo.apply_writes([operation])
+        except PERMANENT_ERRORS as e:
+            with db:
+                db.execute("""INSERT INTO dead_letters (id, kind, payload, created_at, error, failed_at)
+                              VALUES (?, ?, ?, ?, ?, ?)""", (row_id, kind, payload, created_at, str(e), time.time()))
+                db.execute("DELETE FROM pending WHERE id = ?", (row_id,))
+            _status['dead_lettered'] += 1
+            continue
+        with db:
+            db.execute("DELETE FROM pending WHERE id = ?", (row_id,))
+        users.add(operation[1]['username'])
+
+def _run():
+    failures = 0
+    while True:
+        _wake.clear()
+        try:
+            count = flush_once()
+            failures = 0
+            _status['last_error'] = None
+            _status['retry_at'] = None
+            _status['flushed'] += count
+            if count == BATCH_SIZE:
+                continue
+        except Exception as e:
+            # Keep everything queued and retry with exponential backoff plus jitter
+            failures += 1
+            _status['failures'] += 1
+            _status['last_error'] = str(e)
+            delay = min(MAX_BACKOFF_SECONDS, FLUSH_INTERVAL_SECONDS * 2 ** failures) * random.uniform(0.5, 1.0)
+            _status['retry_at'] = time.time() + delay
+            time.sleep(delay)
+            continue
+        with _flushed:
+            _flushed.notify_all()
+        _wake.wait(FLUSH_INTERVAL_SECONDS)
+
+def start_flusher():
+    global _flusher, _exit_hook_registered
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_run, name='climb-write-flusher', daemon=True)
+        _flusher.start()
+    if not _exit_hook_registered:
+        atexit.register(_final_flush)
+        _exit_hook_registered = True
+
+def _final_flush():
+    try:
+        while flush_once():
+            pass
+    except Exception as e:
+        print(f"Pending writes kept for next start: {e}")
+
+# Ask the flusher to write now and wait (bounded) until the queue is empty
+def flush_now(timeout=5):
+    deadline = time.time() + timeout
+    _wake.set()
+    while pending_count():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        with _flushed:
+            _flushed.wait(min(remaining, FLUSH_INTERVAL_SECONDS))
+    return True